@@ -1,20 +1,40 @@
 import sublime
 import sublime_plugin
+import bisect
 import collections
+import concurrent.futures
+import functools
+import hashlib
+import heapq
 import io
 import os
+import pickle
 import platform
 import re
+import struct
 import subprocess
+import sys
+import threading
+import time
+import types
 import zipfile
 
 # SETTINGS START
-class_cache_size = 64
+# Maximum number of classes and approximate bytes kept in memory
+class_cache_size = 256
+class_cache_max_bytes = 32 * 1024 * 1024
 
 java_library_completions = True
 # Full path to the src.zip located in the JDK you're using (None to search for it)
 java_library_path = None
 
+# Complete from the *-sources.jar files of dependencies in ~/.m2 and ~/.gradle/caches
+source_archive_discovery = True
+# Additional source archives (*-sources.jar or *.zip)
+source_archives = []
+# Most source archives kept open at once
+max_open_source_archives = 16
+
 show_static_methods = True
 show_instance_fields = True
 show_static_fields = True
@@ -25,8 +45,38 @@ override_class_autocompletes = {} # Prioritizing duplicate classnames
 override_class_autocompletes['List'] = 'ArrayList'
 override_class_autocompletes['Map'] = 'HashMap'
 
-max_open_file_search = 2048
 max_file_search = 16384
+
+# Keep parsed classes on disk so they survive restarts
+class_disk_cache = True
+# Days an unused class stays on disk
+class_disk_cache_max_age = 30
+
+# Parse the imported classes and superclasses of opened files in the background
+prefetch_imports = True
+prefetch_workers = 2
+
+# Give up resolving completions after this many milliseconds
+completion_latency_budget = 1500
+
+# Seconds between checks of the project folders for added or removed files
+project_index_refresh_interval = 2
+
+# Most classes suggested on an import line
+max_import_completions = 100
+
+# Most completions shown at once once a prefix is typed, best matches first
+max_completions = 200
+
+# Time the completion pipeline stages, see "Java AutoComplete: Show Timings"
+collect_timings = True
+# Show where the time of the last completion went in the status bar
+show_completion_timings = False
+
+# Threads used by "Java AutoComplete: Index Project" to parse every class into the disk cache
+bulk_index_workers = 2
+# Also parse the classes of the JDK src.zip when indexing a project
+bulk_index_java_library = True
 # SETTINGS END
 
 instanceMethodCompletions = []
@@ -34,10 +84,39 @@ instanceFieldCompletions = []
 staticMethodCompletions = []
 staticFieldCompletions = []
 generalCompletions = []
+ownMemberCompletions = set()
+completion_usage = collections.Counter()
+completions_lock = threading.RLock()
+completion_generation = 0
+completion_executor = None
 java_zip_failed = False
 java_zip_archive = None
 java_zip_file_names = None
-class_cache = collections.OrderedDict()
+java_zip_class_names = None
+java_zip_paths = None
+java_zip_imports = None
+source_archive_index = None
+source_archive_lock = threading.Lock()
+bulk_index_running = False
+stage_stats = collections.OrderedDict() # stage name -> StageStats
+pipeline_counters = collections.Counter()
+stats_lock = threading.Lock()
+stage_timing = threading.local()
+missing_classes = {} # (class name, inner class name, editing file) -> lookup generation of the failed search
+class_lookup_generation = 0
+java_zip_lock = threading.RLock()
+project_index_lock = threading.RLock()
+prefetch_executor = None
+project_indexes = {}
+class_store_version = 4
+buffer_texts = {}
+buffer_models = {}
+symbol_tables = {}
+import_contexts = {}
+chain_types = {}
+bracket_indexes = {}
+buffer_models_lock = threading.RLock()
+empty_members = types.MappingProxyType({})
 
 java_comment_pattern = re.compile(r'''((['"])(?:(?!\2|\\).|\\.)*\2)|\/\/[^\n]*|\/\*(?:[^*]|\*(?!\/))*\*\/''')
 java_method_pattern = "(?:(protected|public|default)\s+)" + \
@@ -52,6 +131,18 @@ java_field_pattern = "(?:(protected|public|default)\s+)" + \
         "(\w+)\s*" + \
         "(?:\s*=\s*[^;]+)?;"
 java_field_pattern = re.compile(java_field_pattern)
+java_interface_method_pattern = "(?:(protected|public|default)\s+)?" + \
+        "((?:(?:abstract|static|final|synchronized|native)\s+)*)" + \
+        "(?:<[^>]*>\s+)?(\w+(?:\[\])?(?:<.*>)?)\s+" + \
+        "(\w+)\s*" + \
+        "\(\s*([^\)]*)\s*\)"
+java_interface_method_pattern = re.compile(java_interface_method_pattern)
+java_interface_field_pattern = "(?:(protected|public|default)\s+)?" + \
+        "((?:(?:transient|volatile|static|final)\s+)*)" + \
+        "(\w+(?:\[\])?(?:<\w+(?:,\s*\w+)?>?)?)\s+" + \
+        "(\w+)\s*" + \
+        "(?:\s*=\s*[^;]+)?;"
+java_interface_field_pattern = re.compile(java_interface_field_pattern)
 java_field_names_pattern = re.compile("(\w+)\s*(?:\s*=\s*[^;,]+)")
 java_class_pattern = "(?:(protected|public|private|default)\s+)?" + \
         "((?:(?:abstract|static|final)\s+)*)" + \
@@ -60,6 +151,79 @@ java_class_pattern = "(?:(protected|public|private|default)\s+)?" + \
         "(?:\s+extends\s+(\w+(?:<\w+(?:,\s*\w+)?>?)?))?" + \
         "(?:\s+implements\s+((?:(?:,\s*)*(?:\w+(?:<\w+(?:,\s*\w+)?>?)?))*))?"
 java_class_pattern = re.compile(java_class_pattern)
+java_declaration_pattern = "(?<![\w$.])((?:[A-Za-z_$][\w$]*\s*\.\s*)*[A-Za-z_$][\w$]*" + \
+        "(?:\s*<[\w$\s,.?<>\[\]]*>)?(?:\s*\[\s*\])*)\s+" + \
+        "([A-Za-z_$][\w$]*)(?=\s*[=;,):\[])|[{}()]"
+java_declaration_pattern = re.compile(java_declaration_pattern)
+java_type_name_pattern = re.compile(r'(?<![\w$.])[\w$]+')
+java_generic_name_pattern = re.compile(r'[\w$.]+\s*')
+java_implements_pattern = re.compile(r'\bimplements\s+')
+java_extends_pattern = re.compile(r'\s*\bextends\s+')
+java_chain_characters = frozenset('0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_$.')
+java_string_literal_pattern = re.compile(r''''[^'\\\n]*(?:\\.[^'\\\n]*)*'|"[^"\\\n]*(?:\\.[^"\\\n]*)*"''')
+java_new_pattern = re.compile("\s*=\s*new\s+((?:[\w$]+\s*\.\s*)*[\w$]+(?:\s*<[\w$\s,.?<>\[\]]*>)?)")
+java_keywords = set(['abstract', 'assert', 'break', 'case', 'catch', 'class', 'const', 'continue', 'default',
+        'do', 'else', 'enum', 'extends', 'final', 'finally', 'goto', 'if', 'implements', 'import', 'instanceof',
+        'interface', 'native', 'new', 'package', 'private', 'protected', 'public', 'return', 'static',
+        'strictfp', 'super', 'switch', 'synchronized', 'this', 'throw', 'throws', 'transient', 'try',
+        'volatile', 'while', 'yield'])
+java_bracket_pattern = re.compile(r'[(){}\[\]<>;=&|]')
+java_package_pattern = re.compile(r'^\s*package\s+([\w.]+)\s*;', re.MULTILINE)
+java_import_pattern = re.compile(r'^\s*(package|import)\s+(static\s+)?([\w$]+(?:\s*\.\s*(?:[\w$]+|\*))*)\s*;', re.MULTILINE)
+java_token_pattern = re.compile(r'''\/\/[^\n]*|\/\*[^*]*\*+(?:[^\/*][^*]*\*+)*\/|\/\*|"[^"\\\n]*(?:\\.[^"\\\n]*)*"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'|[{};]''')
+
+class StageStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.total = 0.0
+        self.samples = collections.deque(maxlen = 256)
+
+def timedStage(name):
+    # Records calls and inclusive time per stage, and the time spent in the stage itself for the
+    # current thread's breakdown, so nested stages are not counted twice
+    stats = stage_stats[name] = StageStats()
+    def decorate(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if not collect_timings:
+                return function(*args, **kwargs)
+            try:
+                stack = stage_timing.stack
+            except AttributeError:
+                stack = stage_timing.stack = []
+                stage_timing.breakdown = {}
+            childTime = [0.0]
+            stack.append(childTime)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                if stack:
+                    stack[-1][0] += elapsed
+                breakdown = stage_timing.breakdown
+                breakdown[name] = breakdown.get(name, 0) + elapsed - childTime[0]
+                with stats_lock:
+                    stats.calls += 1
+                    stats.total += elapsed
+                    stats.samples.append(elapsed)
+        return timed
+    return decorate
+
+def countStat(name, amount = 1):
+    if collect_timings:
+        with stats_lock:
+            pipeline_counters[name] += amount
+
+def plugin_loaded():
+    if class_disk_cache:
+        sublime.set_timeout_async(pruneClassStore, 0)
+    if java_library_completions:
+        sublime.set_timeout_async(getSourceArchiveIndex, 0)
 
 class PeriodAutocompleteCommand(sublime_plugin.TextCommand):
     def run(self, edit):
@@ -67,33 +231,20 @@ class PeriodAutocompleteCommand(sublime_plugin.TextCommand):
         self.view.insert(edit, sel.end(), '.')
         if not isJavaFile(self.view):
             return
-        findClassCompletions(self.view, sel)
-        imLen = len(instanceMethodCompletions)
-        ifLen = len(instanceFieldCompletions)
-        smLen = len(staticMethodCompletions)
-        sfLen = len(staticFieldCompletions)
-        if imLen == 0 and smLen == 0 and ifLen == 0 and sfLen == 0:
-            return
-        self.view.run_command('hide_auto_complete')
-        def show_auto_complete():
-            self.view.run_command('auto_complete', {
-                'disable_auto_insert': True,
-                'api_completions_only': True,
-                'next_completion_if_showing': False,
-                'auto_complete_commit_on_tab': True
-            })
-        sublime.set_timeout(show_auto_complete, 0)
+        requestClassCompletions(self.view, sel)
 
 class ParensAutocompleteCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         sel = self.view.sel()[0]
+        bracketPos = -1
+        if isJavaFile(self.view) and self.view.substr(sel.begin() - 1) == '>':
+            bracketPos = findStartBracket(self.view, sel.begin() - 1, '<>')
         self.view.insert(edit, sel.end(), '(')
         if not isJavaFile(self.view):
             self.view.run_command('insert_snippet', {'contents': '$0)'})
             return
         classWord = self.view.word(sel.begin())
         if self.view.substr(classWord) == '>(':
-            bracketPos = findStartBracket(self.view, classWord.begin(), '<>')
             if bracketPos != -1:
                 classWord = self.view.word(bracketPos)
         if classWord is None:
@@ -107,12 +258,15 @@ class ParensAutocompleteCommand(sublime_plugin.TextCommand):
         if bufferedClass is None:
             self.view.run_command('insert_snippet', {'contents': '$0)'})
             return
+        constructorCompletions = []
         for key, value in bufferedClass.constructors.items():
             if key is None or value is None:
                 continue
             compArgs = methodArgsToCompletion(value)
-            generalCompletions.append((key, compArgs + ')'))
-        if len(generalCompletions) == 0:
+            constructorCompletions.append((key, compArgs + ')'))
+        with completions_lock:
+            generalCompletions.extend(constructorCompletions)
+        if len(constructorCompletions) == 0:
             self.view.run_command('insert_snippet', {'contents': '$0)'})
             return
         self.view.run_command('hide_auto_complete')
@@ -125,32 +279,308 @@ class ParensAutocompleteCommand(sublime_plugin.TextCommand):
             })
         sublime.set_timeout(show_auto_complete, 0)
 
+class JavaIndexProjectCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        global bulk_index_running
+        if not class_disk_cache:
+            sublime.status_message('Java_Autocomplete: indexing needs class_disk_cache')
+            return
+        with completions_lock:
+            if bulk_index_running:
+                return
+            bulk_index_running = True
+        thread = threading.Thread(target = bulkIndexClasses, args = (self.window,))
+        thread.daemon = True
+        thread.start()
+
+class JavaCompletionTimingsCommand(sublime_plugin.WindowCommand):
+    def run(self, reset = False):
+        if reset:
+            with stats_lock:
+                for stats in stage_stats.values():
+                    stats.reset()
+                pipeline_counters.clear()
+            class_cache.hits = class_cache.misses = class_cache.staleReloads = class_cache.evictions = 0
+            sublime.status_message('Java_Autocomplete: timings reset')
+            return
+        print('\n'.join(formatTimings()))
+        self.window.run_command('show_panel', {'panel': 'console'})
+
 class FunctionsAutoComplete(sublime_plugin.EventListener):
     def on_query_completions(self, view, prefix, locations):
         _completions = []
         if not isJavaFile(view):
             return
         checkImport(view, view.substr(view.line(view.sel()[0])))
-        if len(instanceMethodCompletions) > 0:
-            _completions.extend(sorted(list(set(instanceMethodCompletions))))
-        if len(instanceFieldCompletions) > 0:
-            _completions.extend(sorted(list(set(instanceFieldCompletions))))
-        if len(staticMethodCompletions) > 0:
-            _completions.extend(sorted(list(set(staticMethodCompletions))))
-        if len(staticFieldCompletions) > 0:
-            _completions.extend(sorted(list(set(staticFieldCompletions))))
-        if len(generalCompletions) > 0:
-            _completions.extend(sorted(list(set(generalCompletions))))
-        if len(_completions) == 0:
-            return
-        instanceMethodCompletions.clear()
-        instanceFieldCompletions.clear()
-        staticMethodCompletions.clear()
-        staticFieldCompletions.clear()
-        generalCompletions.clear()
+        with completions_lock:
+            _completions = rankCompletions(prefix, [instanceMethodCompletions, instanceFieldCompletions,
+                    staticMethodCompletions, staticFieldCompletions, generalCompletions], ownMemberCompletions)
+            if len(_completions) == 0:
+                return
+            instanceMethodCompletions.clear()
+            instanceFieldCompletions.clear()
+            staticMethodCompletions.clear()
+            staticFieldCompletions.clear()
+            generalCompletions.clear()
+            ownMemberCompletions.clear()
         return _completions
 
+    def on_post_text_command(self, view, command_name, args):
+        if command_name not in ('commit_completion', 'insert_best_completion') or not isJavaFile(view):
+            return
+        # Remember which member was picked so it ranks higher next time
+        point = view.sel()[0].begin()
+        line = view.substr(sublime.Region(view.line(point).begin(), point))
+        match = re.search(r'(\w+)\(?$', line)
+        if match is not None:
+            recordCompletionUsage(match.group(1))
+
+class FunctionsPrefetchImports(sublime_plugin.EventListener):
+    def on_load_async(self, view):
+        if not prefetch_imports or not isJavaFile(view):
+            return
+        prefetchClasses(view)
+
+    def on_activated_async(self, view):
+        if not isJavaFile(view):
+            return
+        pinClassHierarchy(view)
+
+class FunctionsBufferModels(sublime_plugin.EventListener):
+    def on_modified_async(self, view):
+        if view.buffer_id() in buffer_models:
+            getViewBufferedClass(view)
+        if view.buffer_id() in symbol_tables:
+            getSymbolTable(view)
+        if view.buffer_id() in bracket_indexes:
+            getBracketIndex(view)
+
+    def on_close(self, view):
+        with buffer_models_lock:
+            buffer_models.pop(view.buffer_id(), None)
+            symbol_tables.pop(view.buffer_id(), None)
+            import_contexts.pop(view.buffer_id(), None)
+            chain_types.pop(view.buffer_id(), None)
+            bracket_indexes.pop(view.buffer_id(), None)
+            buffer_texts.pop(view.buffer_id(), None)
+
+class NameTable:
+    def __init__(self, items):
+        self.items = {}
+        for key, item in items:
+            self.items.setdefault(key, []).append(item)
+        self.keys = sorted(self.items.keys())
+        self.offsets = []
+        offset = 1
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+        self.text = '\n' + '\n'.join(self.keys) + '\n'
+
+    def get(self, key):
+        return self.items.get(key, [])
+
+    def withPrefix(self, prefix, limit = None):
+        matches = []
+        index = bisect.bisect_left(self.keys, prefix)
+        while index < len(self.keys) and self.keys[index].startswith(prefix):
+            matches.extend(self.items[self.keys[index]])
+            if limit is not None and len(matches) >= limit:
+                return matches[:limit]
+            index += 1
+        return matches
+
+    def containing(self, text):
+        matches = []
+        if len(text) == 0:
+            for key in self.keys:
+                matches.extend(self.items[key])
+            return matches
+        if '\n' in text:
+            return matches
+        pos = self.text.find(text)
+        while pos != -1:
+            index = bisect.bisect_right(self.offsets, pos) - 1
+            key = self.keys[index]
+            matches.extend(self.items[key])
+            pos = self.text.find(text, self.offsets[index] + len(key) + 1)
+        return matches
+
+class ImportTable:
+    def __init__(self, classNames, fileNames):
+        # classNames: fully qualified names, e.g. java.util.List, fileNames: where each one is defined
+        packages = {}
+        for className in classNames:
+            packages.setdefault(className[:className.rfind('.') + 1], []).append(className)
+        self.classNames = NameTable((className.lower(), className) for className in classNames)
+        self.simpleNames = NameTable((className[className.rfind('.') + 1:].lower(), className) for className in classNames)
+        self.packages = NameTable((package.lower(), package) for package in packages.keys() if package != '')
+        self.packageClasses = {} # lowercase package with trailing dot -> class names
+        for package, packageClasses in packages.items():
+            self.packageClasses.setdefault(package.lower(), []).extend(packageClasses)
+        self.files = {} # fully qualified name -> file
+        for className, fileName in zip(classNames, fileNames):
+            self.files.setdefault(className, fileName)
+
+class FunctionsProjectIndex(sublime_plugin.EventListener):
+    def on_post_save(self, view):
+        if not isJavaFile(view):
+            return
+        fileName = view.file_name()
+        directory = os.path.dirname(fileName)
+        with project_index_lock:
+            for index in project_indexes.values():
+                entry = index.directories.get(directory)
+                if entry is None:
+                    continue
+                if fileName not in entry[2]:
+                    entry[2].append(fileName)
+                    indexFile(index, fileName)
+                package = readJavaPackage(fileName)
+                if package != entry[3]:
+                    entry[3] = package
+                    index.generation += 1
+
+class ClassCache:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict() # class name -> (class, approximate size)
+        self.size = 0
+        self.pinned = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.staleReloads = 0
+        self.versions = collections.Counter() # class name -> times it was cached, outlives eviction
+
+    def __contains__(self, className):
+        with self.lock:
+            return className in self.entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def get(self, className):
+        with self.lock:
+            entry = self.entries.get(className)
+            if entry is None:
+                return None
+            self.entries.move_to_end(className)
+            return entry[0]
+
+    def put(self, className, bufferedClass, size):
+        with self.lock:
+            oldEntry = self.entries.pop(className, None)
+            if oldEntry is not None:
+                self.size -= oldEntry[1]
+            self.entries[className] = (bufferedClass, size)
+            self.size += size
+            self.versions[className] += 1
+            self.evict()
+
+    def version(self, className):
+        return self.versions[className]
+
+    def pin(self, classNames):
+        with self.lock:
+            self.pinned = set(classNames)
+
+    def evict(self):
+        for className in list(self.entries.keys()):
+            if len(self.entries) <= class_cache_size and self.size <= class_cache_max_bytes:
+                return
+            if className in self.pinned:
+                continue
+            self.size -= self.entries.pop(className)[1]
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+class_cache = ClassCache()
+
+class SourceArchiveIndex:
+    def __init__(self, archivePaths):
+        self.archivePaths = archivePaths
+        self.entries = [] # (archive index, entry name)
+        classNames = []
+        paths = []
+        for archiveIndex, archivePath in enumerate(archivePaths):
+            try:
+                fileNames = readZipNames(archivePath)
+            except Exception as e:
+                print('Java_Autocomplete: could not index source archive', archivePath, e)
+                continue
+            for fileName in fileNames:
+                if not fileName.endswith('.java') or fileName.endswith('-info.java'):
+                    continue
+                fileNameL = fileName.lower()
+                classNames.append((fileNameL[fileNameL.rfind('/') + 1:-5], len(self.entries)))
+                paths.append((fileNameL, len(self.entries)))
+                self.entries.append((archiveIndex, fileName))
+        self.classNames = NameTable(classNames)
+        self.paths = NameTable(paths)
+        self.imports = None
+
+    def fileName(self, index):
+        archiveIndex, fileName = self.entries[index]
+        return self.archivePaths[archiveIndex] + '!/' + fileName
+
+class ZipFilePool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.archives = collections.OrderedDict() # archive path -> open ZipFile, least recently used first
+
+    def read(self, archivePath, fileName):
+        with self.lock:
+            archive = self.archives.get(archivePath)
+            if archive is None:
+                archive = zipfile.ZipFile(archivePath)
+                self.archives[archivePath] = archive
+                while len(self.archives) > max(max_open_source_archives, 1):
+                    self.archives.popitem(last = False)[1].close()
+            else:
+                self.archives.move_to_end(archivePath)
+            return archive.read(fileName)
+
+zip_file_pool = ZipFilePool()
+
+class CompletionLists:
+    def __init__(self):
+        self.instanceMethods = []
+        self.instanceFields = []
+        self.staticMethods = []
+        self.staticFields = []
+        self.own = set() # completions declared by the class itself, not inherited
+        self.ownCounts = None
+
+    def isEmpty(self):
+        return len(self.instanceMethods) == 0 and len(self.instanceFields) == 0 and \
+                len(self.staticMethods) == 0 and len(self.staticFields) == 0
+
+class CompletionRequest:
+    def __init__(self, view, word, generation):
+        self.view = view
+        self.word = word
+        self.generation = generation
+        self.deadline = time.time() + completion_latency_budget / 1000.0
+
+    def check(self):
+        if self.generation != completion_generation or time.time() > self.deadline:
+            raise CompletionCancelled()
+
+class CompletionCancelled(Exception):
+    pass
+
 class BufferedClass:
+    __slots__ = ('fileName', 'modifiedDate', 'outerClass', 'accessModifier', 'extends', 'constructors',
+            'methods', 'fields', 'staticMethods', 'staticFields', 'innerClasses', 'changeCount',
+            'typeParameters', 'implements', 'isInterface', 'ownCompletions', 'completions', 'memberIndex',
+            'resolvedMembers', 'hierarchy')
+
     def __init__(self, fn, md):
         self.fileName = fn
         self.modifiedDate = md
@@ -163,46 +593,140 @@ class BufferedClass:
         self.staticMethods = {}
         self.staticFields = {}
         self.innerClasses = {}
+        self.typeParameters = ()
+        self.implements = ()
+        self.isInterface = False
+        self.changeCount = None
+        self.ownCompletions = None
+        self.completions = None
+        self.memberIndex = None
+        self.resolvedMembers = None
+        self.hierarchy = None
 
 class ClassMethod:
+    __slots__ = ('name', 'type', 'args')
+
     def __init__(self, n, t, a):
-        self.name = n
-        self.type = t
+        self.name = sys.intern(n)
+        self.type = sys.intern(t)
         self.args = a
 
 class ClassField:
+    __slots__ = ('name', 'type')
+
     def __init__(self, n, t, a):
-        self.name = n
-        self.type = t
+        self.name = sys.intern(n)
+        self.type = sys.intern(t)
+
+class BufferModel:
+    def __init__(self, changeCount, text, bufferedClass, spans):
+        self.changeCount = changeCount
+        self.text = text
+        self.bufferedClass = bufferedClass
+        self.spans = spans
+
+class SymbolTable:
+    def __init__(self, changeCount, text):
+        self.changeCount = changeCount
+        self.text = text
+        self.declarations = {} # name -> sorted [position, scope start, scope end, type, new type]
+        self.groups = [] # sorted [open, close, is block, parent index, following block index]
+        self.literals = [] # sorted [start, end] of comments and literals
+
+    def find(self, name, pos):
+        declarations = self.declarations.get(name)
+        if declarations is None:
+            return None
+        index = bisect.bisect_right(declarations, [pos, float('inf')])
+        for declaration in reversed(declarations[:index]):
+            if declaration[1] <= pos <= declaration[2]:
+                return declaration
+        return None
+
+class ImportContext:
+    def __init__(self, changeCount, header):
+        self.changeCount = changeCount
+        self.header = header
+        self.package = '' # with trailing dot
+        self.imports = {} # simple name -> fully qualified name
+        self.wildcards = [] # packages with trailing dot, java.lang last
+        self.files = {} # simple name -> resolved file, None when no candidate exists
+        self.generation = None
+
+    def candidates(self, className):
+        # In the order Java resolves them: single type imports, the file's package, then wildcard imports
+        if '.' in className:
+            return [className]
+        names = []
+        if className in self.imports:
+            names.append(self.imports[className])
+        names.append(self.package + className)
+        names.extend(wildcard + className for wildcard in self.wildcards)
+        return names
+
+class ChainTypes:
+    def __init__(self, context, generation):
+        self.context = context
+        self.generation = generation
+        self.types = {} # (first type, member keys) -> (resolved type, ((class name, cache version), ...))
+
+class BracketIndex:
+    def __init__(self, changeCount, text):
+        self.changeCount = changeCount
+        self.text = text
+        self.baseText = text
+        self.pairs = {} # bracket position -> matching bracket position, in baseText
+        self.edits = [] # (begin, old end, new end) applied since baseText
+
+    def find(self, pos, bracket):
+        basePos = pos
+        for begin, oldEnd, newEnd in reversed(self.edits):
+            if basePos >= newEnd:
+                basePos += oldEnd - newEnd
+            elif basePos >= begin:
+                return -1
+        if basePos >= len(self.baseText) or self.baseText[basePos] != bracket or basePos not in self.pairs:
+            return -1
+        pos = self.pairs[basePos]
+        for begin, oldEnd, newEnd in self.edits:
+            if pos >= oldEnd:
+                pos += newEnd - oldEnd
+        return pos
+
+class ClassFrame:
+    def __init__(self, bufferedClass, className):
+        self.bufferedClass = bufferedClass
+        self.className = className
+        self.parent = None
+        self.owner = None
+        self.innerClassName = None
+        self.level = 0
+        self.pieces = []
+        self.segmentStart = 0
+        self.blockIsMember = False
+        self.memberKeys = []
+        self.constructorPattern = None
+        if className is not None:
+            self.constructorPattern = re.compile('(?:(protected|public|default)\s+)(' + re.escape(className) + ')\s*\(\s*([^\)]*)\s*\)')
+
+class ProjectIndex:
+    def __init__(self, root):
+        self.root = root
+        self.lastRefresh = 0
+        self.directories = {} # directory -> [mtime, subdirectories, java files, package]
+        self.classNames = collections.OrderedDict() # lowercase class name -> [files]
+        self.filePaths = collections.OrderedDict() # lowercase file path -> file
+        self.generation = 0
+        self.imports = None
+        self.importsGeneration = -1
 
 def findEndBracket(text, bracketPos, brackets, missing = False):
-    view = None
     if not isinstance(text, str):
-        if bracketPos == -1:
-            return -1
-        view = text
-        maxRange = min(bracketPos + max_open_file_search, view.size())
-        viewStartOffset = bracketPos
-        viewEndOffset = min(viewStartOffset + 64, view.size())
-        text = view.substr(sublime.Region(viewStartOffset, viewEndOffset))
-    else:
-        maxRange = min(bracketPos + max_file_search, len(text))
+        return findViewBracket(text, bracketPos, brackets[0])
+    maxRange = min(bracketPos + max_file_search, len(text))
     pstack = []
-    textLength = len(text)
     for i in range(bracketPos, maxRange):
-        if view is not None:
-            textOffset = i - viewEndOffset
-            if textOffset >= textLength:
-                viewStartOffset = max(viewStartOffset + 64, textLength)
-                viewEndOffset = max(viewEndOffset + 64, textLength)
-                text = view.substr(sublime.Region(viewStartOffset, viewEndOffset))
-                textLength = len(text)
-                textOffset = i - viewEndOffset
-            if textOffset >= textLength:
-                break
-            c = text[textOffset]
-        else:
-            c = text[i]
+        c = text[i]
         if c == brackets[0]:
             pstack.append(i)
         elif c == brackets[1]:
@@ -215,37 +739,16 @@ def findEndBracket(text, bracketPos, brackets, missing = False):
     return -1
 
 def findStartBracket(text, bracketPos, brackets, missing = False):
-    view = None
     if not isinstance(text, str):
-        if bracketPos == -1:
-            return -1
-        view = text
-        minRange = max(bracketPos - max_open_file_search, -1)
-        viewEndOffset = bracketPos
-        viewStartOffset = max(viewEndOffset - 63, 0)
-        text = view.substr(sublime.Region(viewStartOffset, viewEndOffset + 1))
-    else:
-        minRange = max(bracketPos - max_file_search, -1)
+        return findViewBracket(text, bracketPos, brackets[1])
+    minRange = max(bracketPos - max_file_search, -1)
     pstack = []
     maxRange = bracketPos
     if bracketPos == -1:
         maxRange = len(text) - 1
         minRange = max(maxRange - max_file_search, -1)
-    textLength = len(text)
     for i in range(maxRange, minRange, -1):
-        if view is not None:
-            textOffset = i - viewEndOffset + (textLength - 1)
-            if textOffset < 0:
-                viewStartOffset = max(viewStartOffset - 64, 0)
-                viewEndOffset = max(viewEndOffset - 64, 0)
-                text = view.substr(sublime.Region(viewStartOffset, viewEndOffset + 1))
-                textLength = len(text)
-                textOffset = i - viewEndOffset + (textLength - 1)
-            if textOffset < 0:
-                break
-            c = text[textOffset]
-        else:
-            c = text[i]
+        c = text[i]
         if c == brackets[1]:
             pstack.append(i)
         elif c == brackets[0]:
@@ -257,38 +760,158 @@ def findStartBracket(text, bracketPos, brackets, missing = False):
                 return i
     return -1
 
-def findClassCompletions(view, word):
+def requestClassCompletions(view, word):
+    global completion_generation, completion_executor
+    with completions_lock:
+        completion_generation += 1
+        request = CompletionRequest(view, word, completion_generation)
+    if completion_executor is None:
+        completion_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+    completion_executor.submit(resolveClassCompletions, request)
+
+def resolveClassCompletions(request):
+    lists = CompletionLists()
+    stage_timing.breakdown = {}
+    countStat('completionRequests')
+    try:
+        request.check()
+        findClassCompletions(request.view, request.word, lists, request)
+        request.check()
+    except CompletionCancelled:
+        countStat('completionsCancelled')
+        return
+    except Exception as e:
+        print('Java_Autocomplete: could not resolve completions', e)
+        return
+    finally:
+        if show_completion_timings and collect_timings:
+            showCompletionTimings(request.view, stage_timing.breakdown)
+    if lists.isEmpty():
+        return
+    def show_auto_complete():
+        with completions_lock:
+            if request.generation != completion_generation:
+                return
+            instanceMethodCompletions.extend(lists.instanceMethods)
+            instanceFieldCompletions.extend(lists.instanceFields)
+            staticMethodCompletions.extend(lists.staticMethods)
+            staticFieldCompletions.extend(lists.staticFields)
+            ownMemberCompletions.update(lists.own)
+        request.view.run_command('hide_auto_complete')
+        request.view.run_command('auto_complete', {
+            'disable_auto_insert': True,
+            'api_completions_only': True,
+            'next_completion_if_showing': False,
+            'auto_complete_commit_on_tab': True
+        })
+    sublime.set_timeout(show_auto_complete, 0)
+
+def showCompletionTimings(view, breakdown):
+    total = sum(breakdown.values())
+    stages = sorted(breakdown.items(), key = lambda stage: -stage[1])[:4]
+    parts = ['%s %.1fms' % (name, elapsed * 1000) for name, elapsed in stages if elapsed >= 0.0001]
+    message = 'Java completion %.1fms: %s' % (total * 1000, ', '.join(parts))
+    sublime.set_timeout(lambda: view.set_status('java_autocomplete_timings', message), 0)
+
+def formatTimings():
+    lines = ['Java_Autocomplete timings (p50/p95 over the last 256 calls of each stage)']
+    lines.append('%-22s %8s %10s %9s %9s' % ('stage', 'calls', 'total', 'p50', 'p95'))
+    with stats_lock:
+        for name, stats in stage_stats.items():
+            if stats.calls == 0:
+                continue
+            samples = sorted(stats.samples)
+            lines.append('%-22s %8d %8.1fms %7.2fms %7.2fms' % (name, stats.calls, stats.total * 1000,
+                    samples[len(samples) // 2] * 1000, samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000))
+        counters = dict(pipeline_counters)
+    lines.append('class cache: %d hits, %d misses, %d stale reloads, %d evictions, %d classes, %.1fMB' % (
+            class_cache.hits, class_cache.misses, class_cache.staleReloads, class_cache.evictions,
+            len(class_cache), class_cache.size / 1024 / 1024))
+    lines.append('parsed: %d classes, %.1fMB; disk store: %d hits, %d misses' % (counters.get('classesParsed', 0),
+            counters.get('bytesParsed', 0) / 1024 / 1024, counters.get('storeHits', 0), counters.get('storeMisses', 0)))
+    lines.append('completion requests: %d, cancelled: %d' % (counters.get('completionRequests', 0),
+            counters.get('completionsCancelled', 0)))
+    return lines
+
+def findViewBracket(view, bracketPos, bracket):
+    if bracketPos == -1:
+        return -1
+    return getBracketIndex(view).find(bracketPos, bracket)
+
+def getBracketIndex(view):
+    with buffer_models_lock:
+        changeCount, text = getViewText(view)
+        bracketIndex = bracket_indexes.get(view.buffer_id())
+        if bracketIndex is not None and bracketIndex.changeCount == changeCount:
+            return bracketIndex
+        if bracketIndex is None or len(bracketIndex.edits) >= 64 or not updateBracketIndex(bracketIndex, text):
+            bracketIndex = BracketIndex(changeCount, text)
+            buildBracketIndex(bracketIndex)
+            bracket_indexes[view.buffer_id()] = bracketIndex
+        bracketIndex.changeCount = changeCount
+        bracketIndex.text = text
+        return bracketIndex
+
+def buildBracketIndex(bracketIndex):
+    text = bracketIndex.text
+    masked = maskJavaLiterals(text, findJavaLiterals(text), 0, len(text))
+    pairs = bracketIndex.pairs
+    stacks = {'(': [], '[': [], '{': [], '<': []}
+    closing = {')': '(', ']': '[', '}': '{', '>': '<'}
+    for match in java_bracket_pattern.finditer(masked):
+        c = match.group()
+        pos = match.start()
+        if c in stacks:
+            stacks[c].append(pos)
+            if c != '<':
+                del stacks['<'][:]
+        elif c in closing:
+            if c == '>' and pos > 0 and masked[pos - 1] == '-':
+                continue
+            stack = stacks[closing[c]]
+            if len(stack) > 0:
+                openPos = stack.pop()
+                pairs[openPos] = pos
+                pairs[pos] = openPos
+            if c != '>':
+                del stacks['<'][:]
+        else:
+            # Generic brackets never span statements or expressions
+            del stacks['<'][:]
+
+def updateBracketIndex(bracketIndex, text):
+    # Edits without brackets, comments or literals only shift the positions after them
+    begin, oldEnd, newEnd = findChangedRange(bracketIndex.text, text)
+    if touchesJavaStructure(bracketIndex.text, text, begin, oldEnd, newEnd, '()[]{}<>;=&|'):
+        return False
+    bracketIndex.edits.append((begin, oldEnd, newEnd))
+    return True
+
+def touchesJavaStructure(oldText, text, begin, oldEnd, newEnd, brackets):
+    for c in brackets + '"\'/*\\':
+        if c in oldText[begin:oldEnd] or c in text[begin:newEnd]:
+            return True
+    for junction in (oldText[begin - 1:begin + 1], oldText[oldEnd - 1:oldEnd + 1],
+            text[begin - 1:begin + 1], text[newEnd - 1:newEnd + 1]):
+        if junction in ('//', '/*', '*/', '->'):
+            return True
+    # Line breaks end line comments and string literals
+    if '\n' in oldText[begin:oldEnd] or '\n' in text[begin:newEnd]:
+        lineStart = oldText.rfind('\n', 0, begin) + 1
+        lineEnd = oldText.find('\n', oldEnd)
+        if lineEnd == -1:
+            lineEnd = len(oldText)
+        for c in '"\'/':
+            if oldText.find(c, lineStart, lineEnd) != -1:
+                return True
+    return False
+
+@timedStage('completion')
+def findClassCompletions(view, word, lists, request = None):
     line = view.line(word.begin())
     lineBegin = line.begin()
     line = view.substr(line)
-    line = line[:word.begin() - lineBegin]
-    missingParensPos = findStartBracket(line, -1, '()')
-    if missingParensPos != -1:
-        line = line[missingParensPos + 1:]
-    while True:
-        bracketStart = line.rfind('(')
-        if bracketStart == -1:
-            break;
-        bracketEnd = findEndBracket(line, bracketStart, '()')
-        if bracketEnd == -1:
-            break;
-        line = line[:bracketStart] + line[bracketEnd + 1:]
-    while True:
-        bracketStart = line.rfind('[')
-        if bracketStart == -1:
-            break;
-        bracketEnd = findEndBracket(line, bracketStart, '[]')
-        if bracketEnd == -1:
-            break;
-        line = line[:bracketStart] + line[bracketEnd + 1:]
-    while True:
-        match = re.search('[^0-9a-zA-Z_$.]+', line)
-        if match is None:
-            break
-        match = match.group()
-        startPos = line.find(match)
-        line = line[startPos + len(match):]
-    line = line.strip()
+    line = findChainExpression(line[:word.begin() - lineBegin])
     if line.find('this.') != -1: # Better ways to handle this than handing it back off to Sublime
         line = line[line.find('this.') + 5:]
     keys = line.split('.')
@@ -296,149 +919,609 @@ def findClassCompletions(view, word):
         return
     firstKey = keys[0]
     del keys[0]
-    baseClass = getLocalClass(view, firstKey, word.begin())
+    currentType = getLocalType(view, firstKey, word.begin())
     static = False
-    if baseClass is None:
-        baseClass = firstKey
-        static = True
-    currentClass = lastClass = fromClass = baseClass
-    for index, key in enumerate(keys):
-        currentClass = findKeyClass(view, currentClass, key)
-        static = False
-        if currentClass == 'E' or currentClass == 'V':
-            if index == 0:
-                currentClass = getLocalClass(view, firstKey, word.begin(), True)
-            else:
-                currentClass = findKeyClass(view, fromClass, keys[index - 1], True)
-        fromClass = lastClass
-        lastClass = currentClass
-    addClassCompletions(view, getBufferedClass(view, currentClass), static)
+    if currentType is None:
+        currentType = firstKey.partition('(')[0]
+        static = len(keys) == 0
+    currentType = resolveChainType(view, currentType, keys, request)
+    if request is not None:
+        request.check()
+    if currentType is not None:
+        currentType = splitTypeArguments(currentType)[0]
+    addClassCompletions(view, getBufferedClass(view, currentType), static, lists)
+
+def findChainExpression(line):
+    # The member chain that ends the line, with the argument count of each call
+    # and without indexes: x = a.b(c(1), 2).d[0] -> a.b(2).d
+    if '"' in line or "'" in line:
+        line = java_string_literal_pattern.sub('""', line)
+    chain = []
+    depth = 0
+    call = False
+    arguments = 0
+    pos = len(line)
+    while pos > 0:
+        pos -= 1
+        c = line[pos]
+        if c == ')' or c == ']':
+            if depth == 0:
+                call = c == ')'
+                arguments = 0
+            depth += 1
+        elif c == '(' or c == '[':
+            if depth == 0:
+                break
+            depth -= 1
+            if depth == 0 and call:
+                chain.append('(%d)' % arguments)
+        elif depth == 0:
+            if c not in java_chain_characters:
+                break
+            chain.append(c)
+        elif depth == 1 and call:
+            if c == ',':
+                arguments += 1
+            elif arguments == 0 and not c.isspace():
+                arguments = 1
+    return ''.join(reversed(chain)).strip()
+
+def resolveChainType(view, type, keys, request = None):
+    # Resolved chain prefixes are kept per view, so extending a.b().c(). only resolves the new segment.
+    # An entry holds the cache versions of the classes it read and is dropped when one of them reloads
+    # or no longer matches its file or open view
+    chainTypes = getChainTypes(view)
+    start = 0
+    resolvedType = type
+    dependencies = ()
+    for end in range(len(keys), 0, -1):
+        entry = chainTypes.types.get((type, tuple(keys[:end])))
+        if entry is not None and all(class_cache.version(name) == version and
+                (fileClass is None or isClassCurrent(fileClass)) for name, version, fileClass in entry[1]):
+            start = end
+            resolvedType, dependencies = entry
+            countStat('chainPrefixHits')
+            break
+    for index in range(start, len(keys)):
+        if request is not None:
+            request.check()
+        classes = []
+        resolvedType = findKeyType(view, resolvedType, keys[index], classes)
+        fileClasses = {}
+        for memberClass in classes:
+            name = getCacheName(memberClass)
+            fileClasses[name] = memberClass if memberClass.outerClass is None else class_cache.get(name)
+        dependencies += tuple((name, class_cache.version(name), fileClass) for name, fileClass in fileClasses.items())
+        with buffer_models_lock:
+            if len(chainTypes.types) >= 512:
+                chainTypes.types.clear()
+            chainTypes.types[(type, tuple(keys[:index + 1]))] = (resolvedType, dependencies)
+    return resolvedType
 
-def getLocalClass(view, key, maxPos, classType = False):
+def getChainTypes(view):
+    context = None
+    if isJavaFile(view):
+        context = getImportContext(view)
+    generation = getLookupGeneration()
+    with buffer_models_lock:
+        chainTypes = chain_types.get(view.buffer_id())
+        if chainTypes is None or chainTypes.context is not context or chainTypes.generation != generation:
+            chainTypes = ChainTypes(context, generation)
+            chain_types[view.buffer_id()] = chainTypes
+        return chainTypes
+
+def getCacheName(bufferedClass):
+    if bufferedClass.outerClass is not None:
+        return bufferedClass.outerClass
+    return getClassName(bufferedClass.fileName)
+
+@timedStage('getLocalType')
+def getLocalType(view, key, maxPos):
+    # The variable's type with its generic arguments, e.g. Map<String,List<Foo>>
     if key == 'super':
         className = getClassName(view.file_name())
         bufferedClass = getBufferedClass(view, className)
         if bufferedClass is None or bufferedClass.extends is None:
             return None
         return bufferedClass.extends
-    regions = view.find_all('(?<![\\w])' + re.escape(key) + '\\b')
-    for region in reversed(regions):
-        if region.begin() > maxPos:
-            continue
-        if 'new' not in view.substr(view.word(region.end() + 3)):
-            classWord = view.word(region.begin() - 1)
-            classWordString = re.escape(view.substr(classWord))
-            regionString = re.escape(view.substr(region))
-            wholeString = view.substr(sublime.Region(classWord.begin(), region.end()))
-            if re.search('[^([]\s+' + regionString, wholeString) is None:
+    declaration = getSymbolTable(view).find(key, maxPos)
+    if declaration is not None:
+        type = declaration[3]
+        newType = declaration[4]
+        if newType is None:
+            return type
+        # The created class has the members, a diamond takes its arguments from the declared type
+        newClassName, newArguments = splitTypeArguments(newType)
+        if len(newArguments) == 0 and '<' in type:
+            return newClassName + type[type.find('<'):]
+        return newType
+    return findKeyType(view, getClassName(view.file_name()), key)
+
+def getSymbolTable(view):
+    with buffer_models_lock:
+        changeCount, text = getViewText(view)
+        symbolTable = symbol_tables.get(view.buffer_id())
+        if symbolTable is not None and symbolTable.changeCount == changeCount:
+            return symbolTable
+        if symbolTable is None or not updateSymbolTable(symbolTable, text):
+            symbolTable = SymbolTable(changeCount, text)
+            buildSymbolTable(symbolTable)
+            symbol_tables[view.buffer_id()] = symbolTable
+        symbolTable.changeCount = changeCount
+        symbolTable.text = text
+        return symbolTable
+
+def maskJavaLiterals(text, literals, start, end):
+    pieces = []
+    last = start
+    index = bisect.bisect_left(literals, [start])
+    if index > 0 and literals[index - 1][1] > start:
+        index -= 1
+    while index < len(literals) and literals[index][0] < end:
+        literalStart = max(literals[index][0], start)
+        literalEnd = min(literals[index][1], end)
+        pieces.append(text[last:literalStart])
+        pieces.append(' ' * (literalEnd - literalStart))
+        last = literalEnd
+        index += 1
+    pieces.append(text[last:end])
+    return ''.join(pieces)
+
+def findJavaLiterals(text):
+    literals = []
+    for token in java_token_pattern.finditer(text):
+        c = token.group()[0]
+        if c == '"' or c == "'" or (c == '/' and token.group() != '/*'):
+            literals.append([token.start(), token.end()])
+        elif c == '/':
+            literals.append([token.start(), len(text)])
+            break
+    return literals
+
+def buildSymbolTable(symbolTable):
+    text = symbolTable.text
+    symbolTable.literals = findJavaLiterals(text)
+    masked = maskJavaLiterals(text, symbolTable.literals, 0, len(text))
+    groups = symbolTable.groups
+    stack = []
+    declarations = []
+    for match in java_declaration_pattern.finditer(masked):
+        c = match.group()
+        if c == '{' or c == '(':
+            groups.append([match.start(), len(text), c == '{', stack[-1] if stack else -1, -1])
+            stack.append(len(groups) - 1)
+        elif c == '}' or c == ')':
+            while stack:
+                group = groups[stack.pop()]
+                group[1] = match.start()
+                if group[2] == (c == '}'):
+                    break
+        else:
+            name, declaration = newDeclaration(masked, match, 0)
+            if declaration is not None:
+                declarations.append((name, declaration, stack[-1] if stack else -1))
+    for name, declaration, groupIndex in declarations:
+        setDeclarationScope(symbolTable, declaration, groupIndex)
+        addDeclaration(symbolTable, name, declaration)
+
+def newDeclaration(masked, match, offset):
+    name = match.group(2)
+    type = re.sub('\s+', '', match.group(1))
+    rawType = type.split('<')[0].split('[')[0]
+    rawType = rawType[rawType.rfind('.') + 1:]
+    if rawType in java_keywords or name in java_keywords:
+        return name, None
+    type = rawType + type[type.find('<'):] if '<' in type else rawType
+    newType = None
+    newMatch = java_new_pattern.match(masked, match.end())
+    if newMatch is not None:
+        newType = re.sub('\s+', '', newMatch.group(1))
+        newRawType = newType.split('<')[0]
+        newRawType = newRawType[newRawType.rfind('.') + 1:]
+        newType = newRawType + newType[newType.find('<'):] if '<' in newType else newRawType
+    return name, [match.start(2) + offset, 0, 0, type, newType]
+
+def setDeclarationScope(symbolTable, declaration, groupIndex):
+    # Parameters and for-loop variables belong to the block after their parentheses
+    groups = symbolTable.groups
+    while groupIndex != -1 and not groups[groupIndex][2]:
+        group = groups[groupIndex]
+        if group[4] == -1:
+            group[4] = -2
+            blockIndex = bisect.bisect_right(groups, [group[1], float('inf')])
+            if blockIndex < len(groups) and groups[blockIndex][2]:
+                between = symbolTable.text[group[1] + 1:groups[blockIndex][0]]
+                if re.match('\s*(?:throws\s+[\w$.,\s]+)?$', between) is not None:
+                    group[4] = blockIndex
+        if group[4] >= 0:
+            groupIndex = group[4]
+        else:
+            groupIndex = group[3]
+    if groupIndex == -1:
+        declaration[1] = 0
+        declaration[2] = len(symbolTable.text)
+    else:
+        declaration[1] = groups[groupIndex][0]
+        declaration[2] = groups[groupIndex][1]
+
+def addDeclaration(symbolTable, name, declaration):
+    bisect.insort(symbolTable.declarations.setdefault(name, []), declaration)
+
+def updateSymbolTable(symbolTable, text):
+    # Edits that leave braces, parentheses, comments and literals alone only
+    # move the positions after them and re-scan the edited statements
+    oldText = symbolTable.text
+    begin, oldEnd, newEnd = findChangedRange(oldText, text)
+    if touchesJavaStructure(oldText, text, begin, oldEnd, newEnd, '{}()'):
+        return False
+    literals = symbolTable.literals
+    index = bisect.bisect_right(literals, [begin, float('inf')])
+    if index > 0 and literals[index - 1][1] >= begin:
+        return False
+    if index < len(literals) and literals[index][0] <= oldEnd:
+        return False
+    delta = newEnd - oldEnd
+    for literal in literals[index:]:
+        literal[0] += delta
+        literal[1] += delta
+    start = findStatementStart(text, literals, begin)
+    end = min(len(text), findStatementEnd(text, literals, newEnd) + 1)
+    for group in symbolTable.groups:
+        if group[0] >= oldEnd:
+            group[0] += delta
+        if group[1] >= oldEnd:
+            group[1] += delta
+    for name in list(symbolTable.declarations.keys()):
+        declarations = []
+        for declaration in symbolTable.declarations[name]:
+            if declaration[0] >= start and declaration[0] < end - delta:
                 continue
+            if declaration[0] >= oldEnd:
+                declaration[0] += delta
+            if declaration[1] >= oldEnd:
+                declaration[1] += delta
+            if declaration[2] >= oldEnd:
+                declaration[2] += delta
+            declarations.append(declaration)
+        if len(declarations) > 0:
+            symbolTable.declarations[name] = declarations
         else:
-            classWord = view.word(region.end() + 7)
-            if classType:
-                bracketPos = findEndBracket(view, classWord.end(), '<>')
-                if bracketPos != -1:
-                    classWord = view.word(bracketPos)
-        if view.substr(classWord) == '[] ':
-            classWord = view.word(region.begin() - 3)
-        if view.substr(classWord) == '> ':
-            if classType:
-                classWord = view.word(region.begin() - 2)
-            else:
-                bracketPos = findStartBracket(view, classWord.begin(), '<>')
-                if bracketPos != -1:
-                    classWord = view.word(bracketPos)
-        scopeName = view.scope_name(classWord.begin())
-        if classWord is not None and 'storage.type' in scopeName:
-            return view.substr(classWord)
-        if classWord is not None and 'constant.other' in scopeName:
-            return view.substr(classWord)
-    return findKeyClass(view, getClassName(view.file_name()), key, classType)
-
-def findKeyClass(view, className, key, classType = False):
-    if not key.endswith('('):
-        key += '('
-    origKey = key[:-1]
-    bufferedClass = getBufferedClass(view, className)
-    if bufferedClass is None:
-        return None
-    if bufferedClass.accessModifier == 'private':
-        editingClass = getClassName(view.file_name())
-        if editingClass != className and editingClass != bufferedClass.outerClass:
-            return None
-    for _key, _value in bufferedClass.methods.items():
-        if _key is None or _value is None:
-            continue
-        if key in _key and _value.type is not None:
-            type = _value.type.replace('[]', '')
-            if '<' in type:
-                if classType:
-                    type = type[type.find('<') + 1:type.find('>')]
-                    if type.find(',') != -1:
-                        type = type[type.find(',') + 1:].strip()
-                else:
-                    type = type[:type.find('<')]
-            return type
-    for _key, _value in bufferedClass.staticMethods.items():
-        if _key is None or _value is None:
+            del symbolTable.declarations[name]
+    symbolTable.text = text
+    maskEnd = min(len(text), end + 256)
+    masked = maskJavaLiterals(text, literals, start, maskEnd)
+    for match in java_declaration_pattern.finditer(masked, 0, end - start):
+        if len(match.group()) == 1:
             continue
-        if key in _key and _value.type is not None:
-            if '<' in type:
-                if classType:
-                    type = type[type.find('<') + 1:type.find('>')]
-                    if type.find(',') != -1:
-                        type = type[type.find(',') + 1:].strip()
-                else:
-                    type = type[:type.find('<')]
-            return type
-    for _key, _value in bufferedClass.fields.items():
-        if _key is None or _value is None:
+        name, declaration = newDeclaration(masked, match, start)
+        if declaration is None:
             continue
-        if origKey == _key and _value is not None:
-            type = _value.replace('[]', '')
-            if '<' in type:
-                if classType:
-                    type = type[type.find('<') + 1:type.find('>')]
-                    if type.find(',') != -1:
-                        type = type[type.find(',') + 1:].strip()
-                else:
-                    type = type[:type.find('<')]
-            return type
-    for _key, _value in bufferedClass.staticFields.items():
-        if _key is None or _value is None:
-            continue
-        if origKey == _key and _value is not None:
-            type = _value.replace('[]', '')
-            if '<' in type:
-                if classType:
-                    type = type[type.find('<') + 1:type.find('>')]
-                    if type.find(',') != -1:
-                        type = type[type.find(',') + 1:].strip()
-                else:
-                    type = type[:type.find('<')]
-            return type
-    if bufferedClass.extends is not None:
-        return findKeyClass(view, bufferedClass.extends, key)
-    else:
+        setDeclarationScope(symbolTable, declaration, findInnermostGroup(symbolTable, declaration[0]))
+        addDeclaration(symbolTable, name, declaration)
+    return True
+
+def findStatementStart(text, literals, pos):
+    # Just after the last ';', '{' or '}' before pos outside comments and literals
+    while True:
+        pos = max(text.rfind(';', 0, pos), text.rfind('{', 0, pos), text.rfind('}', 0, pos))
+        if pos == -1:
+            return 0
+        index = bisect.bisect_right(literals, [pos, float('inf')])
+        if index == 0 or literals[index - 1][1] <= pos:
+            return pos + 1
+        pos = literals[index - 1][0]
+
+def findStatementEnd(text, literals, pos):
+    # The first ';', '{' or '}' from pos outside comments and literals
+    while True:
+        ends = [end for end in (text.find(';', pos), text.find('{', pos), text.find('}', pos)) if end != -1]
+        if len(ends) == 0:
+            return len(text)
+        end = min(ends)
+        index = bisect.bisect_right(literals, [end, float('inf')])
+        if index == 0 or literals[index - 1][1] <= end:
+            return end
+        pos = literals[index - 1][1]
+
+def findInnermostGroup(symbolTable, pos):
+    groups = symbolTable.groups
+    groupIndex = bisect.bisect_right(groups, [pos, float('inf')]) - 1
+    while groupIndex != -1 and groups[groupIndex][1] < pos:
+        groupIndex = groups[groupIndex][3]
+    return groupIndex
+
+def findKeyType(view, type, key, dependencies = None):
+    # The member's declared type with the class's type parameters replaced by the arguments of type,
+    # cached per class, member and arguments. The classes searched are added to dependencies
+    if type is None:
+        return None
+    if key.endswith('('):
+        key = key[:-1]
+    className, arguments = splitTypeArguments(type)
+    found = findKeyMember(view, className, key)
+    if found is None:
+        return None
+    member, classes, origins = found
+    if dependencies is not None:
+        dependencies.extend(classes)
+    resolvedTypes = classes[0].resolvedMembers[2]
+    resolvedType = resolvedTypes.get((key, arguments), False)
+    if resolvedType is not False:
+        return resolvedType
+    resolvedType = member[2]
+    if resolvedType is not None and len(arguments) > 0:
+        resolvedType = substituteType(resolvedType, getTypeMapping(classes, origins, member[0], arguments))
+    resolvedTypes[(key, arguments)] = resolvedType
+    return resolvedType
+
+def getTypeMapping(classes, origins, level, arguments):
+    # Follows the extends and implements clauses down to the ancestor that declares the member
+    path = []
+    while level > 0:
+        path.append((level, origins[level][1]))
+        level = origins[level][0]
+    mapping = dict(zip(classes[0].typeParameters, arguments))
+    for index, supertype in reversed(path):
+        superArguments = splitTypeArguments(supertype)[1]
+        mapping = dict(zip(classes[index].typeParameters,
+                [substituteType(argument, mapping) for argument in superArguments]))
+    return mapping
+
+def substituteType(type, mapping):
+    if len(mapping) == 0:
+        return type
+    return java_type_name_pattern.sub(lambda match: mapping.get(match.group(), match.group()), type)
+
+@functools.lru_cache(maxsize = 4096)
+def splitTypeArguments(type):
+    # 'Map<String,List<Foo>>' -> ('Map', ('String', 'List<Foo>')), a wildcard stands for its bound
+    type = type.strip()
+    if type.startswith('?'):
+        type = re.sub('^\?\s*(?:(?:extends|super)\s+)?', '', type)
+        if type == '':
+            return ('Object', ())
+    start = type.find('<')
+    if start == -1:
+        return (rawClassName(type), ())
+    arguments = []
+    depth = 0
+    argumentStart = start + 1
+    for pos in range(start + 1, len(type)):
+        c = type[pos]
+        if c == '<':
+            depth += 1
+        elif c == '>':
+            if depth == 0:
+                arguments.append(type[argumentStart:pos].strip())
+                break
+            depth -= 1
+        elif c == ',' and depth == 0:
+            arguments.append(type[argumentStart:pos].strip())
+            argumentStart = pos + 1
+    return (rawClassName(type[:start]), tuple(argument for argument in arguments if argument != ''))
+
+def rawClassName(type):
+    # Map.Entry is looked up as the inner class Map$Entry, java.util.List as List
+    names = type.replace('[]', '').strip().split('.')
+    if len(names) > 1 and names[-2][:1].isupper():
+        return names[-2] + '$' + names[-1]
+    return names[-1]
+
+def readGenericType(text, pos):
+    # The type starting at pos including its balanced type arguments
+    return text[pos:findGenericTypeEnd(text, pos)].strip()
+
+def findGenericTypeEnd(text, pos):
+    end = java_generic_name_pattern.match(text, pos).end()
+    if end < len(text) and text[end] == '<':
+        depth = 0
+        for end in range(end, len(text)):
+            if text[end] == '<':
+                depth += 1
+            elif text[end] == '>':
+                depth -= 1
+                if depth == 0:
+                    break
+        end += 1
+    return end
+
+def readGenericTypes(text, pos):
+    # A comma separated list of types such as an implements clause
+    types = []
+    while True:
+        end = findGenericTypeEnd(text, pos)
+        if end == pos:
+            return types
+        types.append(text[pos:end].strip())
+        match = re.compile(r'\s*,\s*').match(text, end)
+        if match is None:
+            return types
+        pos = match.end()
+
+def findKeyMember(view, className, key):
+    # (member, classes, origins): member is (ancestor level, raw type, declared type).
+    # A call key such as b(2) picks the overload taking two arguments, then any overload of b
+    bufferedClass = getBufferedClass(view, className)
+    if bufferedClass is None:
         return None
+    ancestors, origins = getClassHierarchy(view, bufferedClass)
+    classes = [bufferedClass] + ancestors
+    if bufferedClass.resolvedMembers is None or not isSameClassChain(bufferedClass.resolvedMembers[1], classes[1:]):
+        bufferedClass.resolvedMembers = ({}, classes[1:], {})
+    resolvedMembers = bufferedClass.resolvedMembers[0]
+    member = resolvedMembers.get(key)
+    if member is None:
+        member = (len(classes) - 1, None, None)
+        name, call, arguments = key.partition('(')
+        if not call:
+            indexKeys = (name,)
+        elif arguments[:-1].isdigit():
+            indexKeys = ((name, int(arguments[:-1])), (name, None))
+        else:
+            indexKeys = ((name, None),)
+        for indexKey in indexKeys:
+            found = False
+            for level, memberClass in enumerate(classes):
+                memberIndex = getMemberIndex(memberClass)
+                if indexKey in memberIndex:
+                    member = (level,) + memberIndex[indexKey]
+                    found = True
+                    break
+            if found:
+                break
+        resolvedMembers[key] = member
+    editingClass = getClassName(view.file_name())
+    level = member[0]
+    while level is not None:
+        memberClass = classes[level]
+        if memberClass.accessModifier == 'private':
+            if editingClass != getClassName(memberClass.fileName) and editingClass != memberClass.outerClass:
+                return None
+        level = origins[level][0] if level > 0 else None
+    return member, classes, origins
+
+def getMemberIndex(bufferedClass):
+    # (raw type, declared type) by field name, (method name, argument count) and
+    # (method name, None) for the first overload. A bare name falls back to the first method
+    if bufferedClass.memberIndex is not None:
+        return bufferedClass.memberIndex
+    memberIndex = {}
+    for fields in (bufferedClass.fields, bufferedClass.staticFields):
+        for key, value in fields.items():
+            if key is not None and value is not None and key not in memberIndex:
+                memberIndex[key] = (splitTypeArguments(value)[0], value)
+    for methods in (bufferedClass.methods, bufferedClass.staticMethods):
+        for value in methods.values():
+            if value is not None and value.type is not None:
+                member = (splitTypeArguments(value.type)[0], value.type)
+                memberIndex.setdefault((value.name, countMethodArgs(value.args)), member)
+                memberIndex.setdefault((value.name, None), member)
+                memberIndex.setdefault(value.name, member)
+    bufferedClass.memberIndex = memberIndex
+    return memberIndex
 
-def addClassCompletions(view, bufferedClass, staticOnly):
+def countMethodArgs(args):
+    # Commas inside type arguments such as Map<K, V> do not separate parameters
+    if args.strip() == '':
+        return 0
+    count = 1
+    depth = 0
+    for c in args:
+        if c == '<':
+            depth += 1
+        elif c == '>':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            count += 1
+    return count
+
+@timedStage('addClassCompletions')
+def addClassCompletions(view, bufferedClass, staticOnly, lists):
     if bufferedClass is None:
         return False
+    completions = getClassCompletions(view, bufferedClass)
+    ownCounts = completions.ownCounts
     if not staticOnly:
-        for key, value in bufferedClass.methods.items():
+        lists.instanceMethods.extend(completions.instanceMethods)
+        lists.instanceFields.extend(completions.instanceFields)
+        lists.own.update(completions.instanceMethods[:ownCounts[0]])
+        lists.own.update(completions.instanceFields[:ownCounts[1]])
+    lists.staticMethods.extend(completions.staticMethods)
+    lists.staticFields.extend(completions.staticFields)
+    lists.own.update(completions.staticMethods[:ownCounts[2]])
+    lists.own.update(completions.staticFields[:ownCounts[3]])
+    return True
+
+def getClassCompletions(view, bufferedClass):
+    # Flattened over the extends chain and rebuilt only when the class or an ancestor was reloaded
+    ancestors = getClassAncestors(view, bufferedClass)
+    if bufferedClass.completions is not None:
+        completions, completionAncestors = bufferedClass.completions
+        if isSameClassChain(ancestors, completionAncestors):
+            return completions
+    completions = CompletionLists()
+    for ancestor in [bufferedClass] + ancestors:
+        ownCompletions = getOwnClassCompletions(ancestor)
+        completions.instanceMethods.extend(ownCompletions.instanceMethods)
+        completions.instanceFields.extend(ownCompletions.instanceFields)
+        completions.staticMethods.extend(ownCompletions.staticMethods)
+        completions.staticFields.extend(ownCompletions.staticFields)
+        if completions.ownCounts is None:
+            completions.ownCounts = (len(completions.instanceMethods), len(completions.instanceFields),
+                    len(completions.staticMethods), len(completions.staticFields))
+    bufferedClass.completions = (completions, ancestors)
+    return completions
+
+def rankCompletions(prefix, completionLists, ownCompletions):
+    # Prefix matches first, then own and recently used members. Sublime only filters the
+    # list it got after a '.', so the empty prefix keeps every member and only caps typed prefixes
+    prefixL = prefix.lower()
+    usage = completion_usage
+    candidates = []
+    seen = set()
+    for order, completions in enumerate(completionLists):
+        for completion in completions:
+            if completion in seen:
+                continue
+            seen.add(completion)
+            trigger = completion[0]
+            if trigger.startswith(prefix):
+                score = 0
+            elif trigger.lower().startswith(prefixL):
+                score = 100
+            elif isSubsequence(prefixL, trigger[:trigger.find('\t')].lower()):
+                score = 200
+            else:
+                continue
+            if completion in ownCompletions:
+                score -= 8
+            if usage:
+                used = usage.get(completion[1].partition('(')[0])
+                if used:
+                    score -= min(used, 8)
+            candidates.append((score, order, completion))
+    if not prefix or len(candidates) <= max_completions:
+        candidates.sort()
+        return [candidate[2] for candidate in candidates]
+    return [candidate[2] for candidate in heapq.nsmallest(max_completions, candidates)]
+
+def isSubsequence(text, target):
+    pos = 0
+    for c in text:
+        pos = target.find(c, pos) + 1
+        if pos == 0:
+            return False
+    return True
+
+def recordCompletionUsage(name):
+    with completions_lock:
+        completion_usage[name] += 1
+        if len(completion_usage) > 4096:
+            # Halve the counts so old picks fade and rarely used names drop out
+            for key, count in list(completion_usage.items()):
+                if count < 2:
+                    del completion_usage[key]
+                else:
+                    completion_usage[key] = count // 2
+
+def getOwnClassCompletions(bufferedClass):
+    if bufferedClass.ownCompletions is not None:
+        return bufferedClass.ownCompletions
+    completions = CompletionLists()
+    for key, value in bufferedClass.methods.items():
+        if key is None or value is None:
+            continue
+        if len(key) > 48:
+            key = key[:48].strip() + '...'
+        compArgs = methodArgsToCompletion(value.args)
+        completions.instanceMethods.append((key + '\t' + value.type, value.name + '(' + compArgs + ')'))
+    if show_instance_fields:
+        for key, value in bufferedClass.fields.items():
             if key is None or value is None:
                 continue
             if len(key) > 48:
                 key = key[:48].strip() + '...'
-            compArgs = methodArgsToCompletion(value.args)
-            instanceMethodCompletions.append((key + '\t' + value.type, value.name + '(' + compArgs + ')'))
-        if show_instance_fields:
-            for key, value in bufferedClass.fields.items():
-                if key is None or value is None:
-                    continue
-                if len(key) > 48:
-                    key = key[:48].strip() + '...'
-                instanceFieldCompletions.append((key + '\t' + value, key))
+            completions.instanceFields.append((key + '\t' + value, key))
     if show_static_methods:
         for key, value in bufferedClass.staticMethods.items():
             if key is None or value is None:
@@ -446,16 +1529,71 @@ def addClassCompletions(view, bufferedClass, staticOnly):
             if len(key) > 48:
                 key = key[:48].strip() + '...'
             compArgs = methodArgsToCompletion(value.args)
-            staticMethodCompletions.append((key + '\t' + value.type, value.name + '(' + compArgs + ')'))
+            completions.staticMethods.append((key + '\t' + value.type, value.name + '(' + compArgs + ')'))
     if show_static_fields:
         for key, value in bufferedClass.staticFields.items():
             if key is None or value is None:
                 continue
             if len(key) > 48:
                 key = key[:48].strip() + '...'
-            staticFieldCompletions.append((key + '\t' + value, key))
-    if bufferedClass.extends is not None:
-        addClassCompletions(view, getBufferedClass(view, bufferedClass.extends), staticOnly)
+            completions.staticFields.append((key + '\t' + value, key))
+    bufferedClass.ownCompletions = completions
+    return completions
+
+def getClassAncestors(view, bufferedClass):
+    return getClassHierarchy(view, bufferedClass)[0]
+
+def getClassHierarchy(view, bufferedClass):
+    # (ancestors, origins): the superclasses nearest first, then every interface once in the order it is
+    # declared, so an interface reached through several paths is walked and listed once. origins[i] is
+    # (index of the subtype, supertype as declared) for ([bufferedClass] + ancestors)[i]. Kept on the
+    # class until an ancestor is cached again or the project index could have changed
+    context = None
+    if isJavaFile(view):
+        context = getImportContext(view)
+    now = time.time()
+    hierarchy = bufferedClass.hierarchy
+    if hierarchy is not None and hierarchy[3] is context and now - hierarchy[4] < project_index_refresh_interval:
+        if all(class_cache.version(name) == version for name, version in hierarchy[2]):
+            return hierarchy[0], hierarchy[1]
+    classes = [bufferedClass]
+    origins = [None]
+    current = 0
+    while classes[current].extends is not None and len(classes) <= 16:
+        ancestor = getBufferedClass(view, classes[current].extends)
+        if ancestor is None or ancestor in classes:
+            break
+        classes.append(ancestor)
+        origins.append((current, classes[current].extends))
+        current = len(classes) - 1
+    supertypes = [(index, supertype) for index in range(len(classes)) for supertype in classes[index].implements]
+    queued = set()
+    for subtype, supertype in supertypes:
+        if len(classes) >= 64:
+            break
+        name = splitTypeArguments(supertype)[0]
+        if name in queued:
+            continue
+        queued.add(name)
+        ancestor = getBufferedClass(view, name)
+        if ancestor is None or ancestor in classes:
+            continue
+        classes.append(ancestor)
+        origins.append((subtype, supertype))
+        if ancestor.extends is not None:
+            supertypes.append((len(classes) - 1, ancestor.extends))
+        supertypes.extend((len(classes) - 1, supertype) for supertype in ancestor.implements)
+    ancestors = classes[1:]
+    dependencies = tuple((name, class_cache.version(name)) for name in set(map(getCacheName, ancestors)))
+    bufferedClass.hierarchy = (ancestors, origins, dependencies, context, now)
+    return ancestors, origins
+
+def isSameClassChain(classes, otherClasses):
+    if len(classes) != len(otherClasses):
+        return False
+    for bufferedClass, otherClass in zip(classes, otherClasses):
+        if bufferedClass is not otherClass:
+            return False
     return True
 
 def methodArgsToCompletion(args):
@@ -466,43 +1604,28 @@ def methodArgsToCompletion(args):
         num = num + 1
     return args
 
-def findClass(className, exactMatch):
+@timedStage('findClass')
+def findClass(className, exactMatch, view = None):
+    if exactMatch and view is not None:
+        fileName = resolveClassFile(view, className)
+        if fileName is not None:
+            return fileName
     fileNames = findClassesFromFile(sublime.active_window().extract_variables()["file"], className, exactMatch)
     if fileNames and len(fileNames) > 0:
         return fileNames[0]
     for file in sublime.active_window().folders():
-        fileNames = findClassesFromDir(file, className, exactMatch)
+        fileNames = findClassesFromIndex(file, className, exactMatch)
         if fileNames and len(fileNames) > 0:
             return fileNames[0]
     return findClassFromZip(className, exactMatch)
 
-def findClasses(className, exactMatch):
-    matches = []
-    for file in sublime.active_window().folders():
-        matches.extend(findClassesFromDir(file, className, exactMatch))
-    matches.extend(findClassesFromZip(className, exactMatch))
-    return matches
-
-def findClassesFromDir(directory, className, exactMatch, classNameL = None):
+def findClassesFromFile(fileName, className, exactMatch):
+    # Only the editing file itself, project folders are searched through their index
     matches = []
     if className is None:
         return matches
     classNameL = className.lower()
-    for fileName in os.listdir(directory):
-        matches += (findClassesFromFile(os.path.join(directory, fileName), className, exactMatch, classNameL))
-    return matches
-
-def findClassesFromFile(fileName, className, exactMatch, classNameL = None):
-    matches = []
-    if className is None:
-        return matches
-    if classNameL is None:
-        classNameL = className.lower()
     fileNameL = fileName.replace('\\', '/').lower()
-    if os.path.isdir(fileName):
-        foundClasses = findClassesFromDir(fileName, className, exactMatch, classNameL)
-        if foundClasses is not None:
-            matches.extend(foundClasses)
     if not fileNameL.endswith('.java'):
         return matches
     if exactMatch and fileNameL == classNameL:
@@ -515,37 +1638,378 @@ def findClassesFromFile(fileName, className, exactMatch, classNameL = None):
         matches.append(fileName)
     return matches
 
+def findClassesFromIndex(directory, className, exactMatch):
+    if className is None:
+        return []
+    with project_index_lock:
+        return findClassesFromProjectIndex(getProjectIndex(directory), className, exactMatch)
+
+def findClassesFromProjectIndex(index, className, exactMatch):
+    matches = []
+    classNameL = className.replace('\\', '/').lower()
+    if exactMatch:
+        if classNameL in index.filePaths:
+            matches.append(index.filePaths[classNameL])
+        for fileName in index.classNames.get(classNameL, []):
+            if fileName not in matches:
+                matches.append(fileName)
+        return matches
+    for name, fileNames in index.classNames.items():
+        if classNameL in name:
+            matches.extend(fileNames)
+    if '/' in classNameL:
+        for fileNameL, fileName in index.filePaths.items():
+            if classNameL in fileNameL and fileName not in matches:
+                matches.append(fileName)
+    return matches
+
+def getProjectIndex(directory):
+    index = project_indexes.get(directory)
+    if index is None:
+        index = ProjectIndex(directory)
+        indexDirectory(index, directory)
+        index.lastRefresh = time.time()
+        project_indexes[directory] = index
+    elif time.time() - index.lastRefresh >= project_index_refresh_interval:
+        refreshProjectIndex(index)
+    return index
+
+def refreshProjectIndex(index):
+    for directory in list(index.directories.keys()):
+        if directory not in index.directories:
+            continue
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            unindexDirectory(index, directory)
+            continue
+        if mtime != index.directories[directory][0]:
+            indexDirectory(index, directory)
+    index.lastRefresh = time.time()
+
+def indexDirectory(index, directory):
+    try:
+        mtime = os.stat(directory).st_mtime
+        fileNames = os.listdir(directory)
+    except OSError:
+        unindexDirectory(index, directory)
+        return
+    subdirectories = []
+    javaFiles = []
+    for fileName in fileNames:
+        fileName = os.path.join(directory, fileName)
+        if os.path.isdir(fileName):
+            subdirectories.append(fileName)
+        elif fileName.lower().endswith('.java'):
+            javaFiles.append(fileName)
+    oldEntry = index.directories.get(directory)
+    package = None
+    if len(javaFiles) > 0:
+        package = readJavaPackage(javaFiles[0])
+    index.directories[directory] = [mtime, subdirectories, javaFiles, package]
+    if oldEntry is None or oldEntry[3] != package:
+        index.generation += 1
+    if oldEntry is not None:
+        for fileName in set(oldEntry[2]).difference(javaFiles):
+            unindexFile(index, fileName)
+        for subdirectory in set(oldEntry[1]).difference(subdirectories):
+            unindexDirectory(index, subdirectory)
+    for fileName in javaFiles:
+        indexFile(index, fileName)
+    for subdirectory in subdirectories:
+        if subdirectory not in index.directories:
+            indexDirectory(index, subdirectory)
+
+def unindexDirectory(index, directory):
+    entry = index.directories.pop(directory, None)
+    if entry is None:
+        return
+    for fileName in entry[2]:
+        unindexFile(index, fileName)
+    for subdirectory in entry[1]:
+        unindexDirectory(index, subdirectory)
+
+def indexFile(index, fileName):
+    fileNameL = fileName.replace('\\', '/').lower()
+    if fileNameL in index.filePaths:
+        return
+    index.filePaths[fileNameL] = fileName
+    name = fileNameL[fileNameL.rfind('/') + 1:-5]
+    index.classNames.setdefault(name, []).append(fileName)
+    index.generation += 1
+
+def unindexFile(index, fileName):
+    fileNameL = fileName.replace('\\', '/').lower()
+    if index.filePaths.pop(fileNameL, None) is None:
+        return
+    index.generation += 1
+    name = fileNameL[fileNameL.rfind('/') + 1:-5]
+    fileNames = index.classNames.get(name)
+    if fileNames is not None and fileName in fileNames:
+        fileNames.remove(fileName)
+        if len(fileNames) == 0:
+            del index.classNames[name]
+
+def readJavaPackage(fileName):
+    try:
+        with open(fileName, 'r', encoding = 'utf-8', errors = 'replace') as file:
+            header = file.read(4096)
+    except OSError:
+        return None
+    match = java_package_pattern.search(header)
+    if match is None:
+        return ''
+    return match.group(1)
+
+def getImportTable(index):
+    if index.imports is None or index.importsGeneration != index.generation:
+        classNames = []
+        fileNames = []
+        for entry in index.directories.values():
+            if entry[3] is None:
+                continue
+            for fileName in entry[2]:
+                className = os.path.basename(fileName)[:-5]
+                if entry[3] != '':
+                    className = entry[3] + '.' + className
+                classNames.append(className)
+                fileNames.append(fileName)
+        index.imports = ImportTable(classNames, fileNames)
+        index.importsGeneration = index.generation
+    return index.imports
+
+def getZipImportTable():
+    global java_zip_imports
+    loadJavaZip()
+    if java_zip_file_names is None:
+        return None
+    with java_zip_lock:
+        if java_zip_imports is None:
+            classNames = []
+            fileNames = []
+            for fileName in java_zip_file_names:
+                if not fileName.endswith('.java') or fileName.endswith('-info.java'):
+                    continue
+                className = fileName.replace('\\', '/')[:-5]
+                # JDK 9+ archives start with the module name
+                if '.' in className[:className.find('/')]:
+                    className = className[className.find('/') + 1:]
+                classNames.append(className.replace('/', '.'))
+                fileNames.append(fileName)
+            java_zip_imports = ImportTable(classNames, fileNames)
+        return java_zip_imports
+
+def getSourceArchiveImportTable():
+    index = getSourceArchiveIndex()
+    if index is None:
+        return None
+    with source_archive_lock:
+        if index.imports is None:
+            index.imports = ImportTable([fileName[:-5].replace('/', '.') for archiveIndex, fileName in index.entries],
+                    [index.fileName(entryIndex) for entryIndex in range(len(index.entries))])
+        return index.imports
+
+def findImports(name):
+    nameL = name.lower()
+    with project_index_lock:
+        tables = [getImportTable(getProjectIndex(folder)) for folder in sublime.active_window().folders()]
+    for table in (getZipImportTable(), getSourceArchiveImportTable()):
+        if table is not None:
+            tables.append(table)
+    classNames = []
+    packages = []
+    for table in tables:
+        if nameL.endswith('.*'):
+            classNames.extend(table.packageClasses.get(nameL[:-1], []))
+            continue
+        classNames.extend(table.classNames.withPrefix(nameL, max_import_completions))
+        if '.' not in nameL:
+            classNames.extend(table.simpleNames.withPrefix(nameL, max_import_completions))
+        packages.extend(table.packages.withPrefix(nameL, max_import_completions))
+    classNames = sorted(set(classNames), key = lambda className: (className.lower(), className))
+    packages = sorted(set(packages))
+    return classNames[:max_import_completions], packages[:max_import_completions]
+
+def getImportContext(view):
+    changeCount, text = getViewText(view)
+    with buffer_models_lock:
+        context = import_contexts.get(view.buffer_id())
+        if context is not None and context.changeCount == changeCount:
+            return context
+        end = text.find('{')
+        if end == -1:
+            end = len(text)
+        header = tuple(java_import_pattern.findall(text, 0, end))
+        # Edits below the imports keep the names resolved so far
+        if context is None or context.header != header:
+            context = buildImportContext(changeCount, header)
+            import_contexts[view.buffer_id()] = context
+        context.changeCount = changeCount
+        return context
+
+def buildImportContext(changeCount, header):
+    context = ImportContext(changeCount, header)
+    for keyword, static, name in header:
+        name = re.sub(r'\s+', '', name)
+        if keyword == 'package':
+            context.package = name + '.'
+        elif static:
+            continue
+        elif name.endswith('.*'):
+            context.wildcards.append(name[:-1])
+        else:
+            context.imports[name[name.rfind('.') + 1:]] = name
+    context.wildcards.append('java.lang.')
+    return context
+
+def resolveClassFile(view, className, cached = False):
+    # cached: accept a file resolved before without checking whether new classes have appeared
+    if not isJavaFile(view):
+        return None
+    context = getImportContext(view)
+    if cached:
+        fileName = context.files.get(className, False)
+        if fileName is not False:
+            return fileName
+    lookupGeneration = getLookupGeneration()
+    with buffer_models_lock:
+        if context.generation != lookupGeneration:
+            context.files = {}
+            context.generation = lookupGeneration
+        if className in context.files:
+            return context.files[className]
+    countStat('directResolutions')
+    fileName = None
+    for qualifiedName in context.candidates(className):
+        fileName = findQualifiedClass(qualifiedName)
+        if fileName is not None:
+            break
+    with buffer_models_lock:
+        if context.generation == lookupGeneration:
+            context.files[className] = fileName
+    return fileName
+
+def findQualifiedClass(qualifiedName):
+    with project_index_lock:
+        for folder in sublime.active_window().folders():
+            fileName = getImportTable(getProjectIndex(folder)).files.get(qualifiedName)
+            if fileName is not None:
+                return fileName
+    for table in (getZipImportTable(), getSourceArchiveImportTable()):
+        if table is not None and qualifiedName in table.files:
+            return table.files[qualifiedName]
+    return None
+
 def findClassFromZip(className, exactMatch):
     fileNames = findClassesFromZip(className, exactMatch)
     if fileNames and len(fileNames) > 0:
         return fileNames[0]
 
+@timedStage('findClassesFromZip')
 def findClassesFromZip(className, exactMatch):
     loadJavaZip()
     matches = []
-    if java_zip_archive is None:
-        return matches
     if className is None:
         return matches
-    classNameL = className.lower()
-    for fileName in java_zip_file_names:
-        fileNameL = fileName.replace('\\', '/').lower()
-        if not fileName.endswith('.java'):
-            continue
-        if exactMatch and fileNameL == classNameL:
-            matches.append(fileName)
-        if exactMatch and '/' in fileNameL and fileNameL[(fileNameL.rindex('/') + 1):-5] == classNameL:
-            matches.append(fileName)
-        if not exactMatch and '/' in fileNameL and classNameL in fileNameL[(fileNameL.rindex('/') + 1):-5]:
-            matches.append(fileName)
-        if not exactMatch and '/' in fileNameL and '/' in classNameL and classNameL in fileNameL:
-            matches.append(fileName)
+    classNameL = className.replace('\\', '/').lower()
+    if java_zip_archive is not None:
+        for index in findZipIndexes(java_zip_class_names, java_zip_paths, classNameL, exactMatch):
+            matches.append(java_zip_file_names[index])
+    sourceArchiveIndex = getSourceArchiveIndex()
+    if sourceArchiveIndex is not None:
+        for index in findZipIndexes(sourceArchiveIndex.classNames, sourceArchiveIndex.paths, classNameL, exactMatch):
+            matches.append(sourceArchiveIndex.fileName(index))
     return matches
 
+def findZipIndexes(classNames, paths, classNameL, exactMatch):
+    if exactMatch:
+        indexes = paths.get(classNameL) + classNames.get(classNameL)
+    else:
+        indexes = classNames.containing(classNameL)
+        if '/' in classNameL:
+            indexes += paths.containing(classNameL)
+    return sorted(set(indexes))
+
+def getSourceArchiveIndex():
+    global source_archive_index, class_lookup_generation
+    if not java_library_completions:
+        return None
+    if source_archive_index is not None:
+        return source_archive_index
+    with source_archive_lock:
+        if source_archive_index is None:
+            archivePaths = findSourceArchives()
+            source_archive_index = SourceArchiveIndex(archivePaths)
+            class_lookup_generation += 1
+        return source_archive_index
+
+def readZipNames(archivePath):
+    # Only the names in the central directory are read, entries are decompressed on use
+    with open(archivePath, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(max(size - 65557, 0))
+        tail = f.read()
+        end = tail.rfind(b'PK\x05\x06')
+        if end != -1 and len(tail) >= end + 22:
+            count, directorySize, directoryOffset = struct.unpack('<10xHII', tail[end:end + 20])
+            f.seek(directoryOffset)
+            directory = f.read(directorySize)
+        else:
+            count = 0xffff
+    fileNames = []
+    pos = 0
+    # Zip64 archives and archives with leading data are left to zipfile
+    if count != 0xffff and directoryOffset != 0xffffffff:
+        for i in range(count):
+            if directory[pos:pos + 4] != b'PK\x01\x02':
+                break
+            flags = struct.unpack_from('<H', directory, pos + 8)[0]
+            nameLength, extraLength, commentLength = struct.unpack_from('<HHH', directory, pos + 28)
+            fileName = directory[pos + 46:pos + 46 + nameLength]
+            fileNames.append(fileName.decode('utf-8' if flags & 0x800 else 'cp437'))
+            pos += 46 + nameLength + extraLength + commentLength
+        else:
+            return fileNames
+    with zipfile.ZipFile(archivePath) as archive:
+        return archive.namelist()
+
+def findSourceArchives():
+    archivePaths = [os.path.expanduser(archivePath) for archivePath in source_archives]
+    if not source_archive_discovery:
+        return archivePaths
+    # Keep the newest jar of each artifact: .m2 uses artifact/version/jar, Gradle artifact/version/hash/jar
+    newest = {}
+    for root, depth in ((os.path.join('~', '.m2', 'repository'), 2), (os.path.join('~', '.gradle', 'caches', 'modules-2', 'files-2.1'), 3)):
+        for directory, subdirectories, fileNames in os.walk(os.path.expanduser(root)):
+            for fileName in fileNames:
+                if not fileName.endswith('-sources.jar'):
+                    continue
+                archivePath = os.path.join(directory, fileName)
+                artifact = archivePath
+                for i in range(depth):
+                    artifact = os.path.dirname(artifact)
+                try:
+                    mtime = os.path.getmtime(archivePath)
+                except OSError:
+                    continue
+                if artifact not in newest or mtime > newest[artifact][0]:
+                    newest[artifact] = (mtime, archivePath)
+    for artifact in sorted(newest.keys()):
+        if newest[artifact][1] not in archivePaths:
+            archivePaths.append(newest[artifact][1])
+    return archivePaths
+
 def loadJavaZip():
-    global java_zip_failed, java_zip_archive, java_zip_file_names
     if not java_library_completions or java_zip_failed or java_zip_archive or java_zip_file_names:
         return
+    with java_zip_lock:
+        openJavaZip()
+
+def openJavaZip():
+    global java_zip_failed, java_zip_archive, java_zip_file_names, java_zip_class_names, java_zip_paths, class_lookup_generation
+    if java_zip_failed or java_zip_archive or java_zip_file_names:
+        return
     javaPath = None
     whichPath = java_library_path
     if java_library_path is None:
@@ -578,8 +2042,22 @@ def loadJavaZip():
     if javaPath is None:
         java_zip_failed = True
         return
-    java_zip_archive = zipfile.ZipFile(javaPath)
-    java_zip_file_names = java_zip_archive.namelist()
+    archive = zipfile.ZipFile(javaPath)
+    fileNames = archive.namelist()
+    classNames = []
+    paths = []
+    for index, fileName in enumerate(fileNames):
+        if not fileName.endswith('.java'):
+            continue
+        fileNameL = fileName.replace('\\', '/').lower()
+        if '/' in fileNameL:
+            classNames.append((fileNameL[fileNameL.rindex('/') + 1:-5], index))
+        paths.append((fileNameL, index))
+    java_zip_class_names = NameTable(classNames)
+    java_zip_paths = NameTable(paths)
+    java_zip_file_names = fileNames
+    java_zip_archive = archive
+    class_lookup_generation += 1
 
 def which(search = None):
     if search:
@@ -595,7 +2073,10 @@ def which(search = None):
 def getBufferedClass(view, className):
     if className is None:
         return None
+    missKey = None
     subClassName = None
+    if '<' in className:
+        className = className[:className.find('<')]
     if '$' in className:
         indexof = className.find('$')
         subClassName = className[indexof + 1:]
@@ -603,157 +2084,631 @@ def getBufferedClass(view, className):
     if className in override_class_autocompletes:
         className = override_class_autocompletes[className]
     matchedBufferedClass = None
-    if className in class_cache:
-        bufferedClass = class_cache[className]
-        md = bufferedClass.modifiedDate
-        if md == 0 or subClassName is not None or md == os.path.getmtime(bufferedClass.fileName):
+    bufferedClass = class_cache.get(className)
+    if bufferedClass is None:
+        class_cache.misses += 1
+    else:
+        if isClassCurrent(bufferedClass, subClassName is None):
             matchedBufferedClass = bufferedClass
+        # The cache is keyed by simple name, another class of that name may be the one this file imports
+        if matchedBufferedClass is not None and resolveClassFile(view, className, True) not in (None, bufferedClass.fileName):
+            matchedBufferedClass = None
+            class_cache.misses += 1
+        elif matchedBufferedClass is None:
+            class_cache.staleReloads += 1
+        else:
+            class_cache.hits += 1
     if matchedBufferedClass is None:
-        fileName = findClass(className, True)
-        if fileName is not None and os.path.isfile(fileName):
-            fileDate = os.path.getmtime(fileName)
-            with open(fileName, 'r') as f:
-                matchedBufferedClass = addBufferedClass(fileName, f.read())
+        # Names that could not be found stay missing until a class may have appeared
+        missKey = (className, subClassName, view.file_name())
+        lookupGeneration = getLookupGeneration()
+        if missing_classes.get(missKey) == lookupGeneration:
+            countStat('negativeHits')
+            return None
+        fileName = findClass(className, True, view)
+        openView = None
+        if fileName is not None:
+            openView = findOpenView(fileName)
+        if openView is not None:
+            matchedBufferedClass = getViewBufferedClass(openView)
+        elif fileName is not None and os.path.isfile(fileName):
+            fileStat = os.stat(fileName)
+            storeKey = ('file', fileName, fileStat.st_mtime, fileStat.st_size)
+            matchedBufferedClass = loadStoredClass(storeKey)
+            if matchedBufferedClass is None:
+                with open(fileName, 'r') as f:
+                    matchedBufferedClass = addBufferedClass(fileName, f.read())
+                saveStoredClass(storeKey, matchedBufferedClass)
         else:
-            fileName = findClassFromZip(className, True)
-            if java_zip_archive is not None and fileName is not None:
-                with java_zip_archive.open(fileName, 'r') as f:
-                    fileData = f.read().decode('utf-8').replace('\\n', '\n')
+            if fileName is None or os.path.isabs(fileName) and '!/' not in fileName:
+                fileName = findClassFromZip(className, True)
+            if fileName is not None and '!/' in fileName:
+                matchedBufferedClass = getArchiveBufferedClass(fileName)
+            elif java_zip_archive is not None and fileName is not None:
+                storeKey = ('zip', java_zip_archive.filename, fileName, java_zip_archive.getinfo(fileName).CRC)
+                matchedBufferedClass = loadStoredClass(storeKey)
+                if matchedBufferedClass is None:
+                    with java_zip_lock:
+                        with java_zip_archive.open(fileName, 'r') as f:
+                            fileData = f.read().decode('utf-8').replace('\\n', '\n')
                     matchedBufferedClass = addBufferedClass(fileName, fileData)
+                    saveStoredClass(storeKey, matchedBufferedClass)
     if matchedBufferedClass is not None and subClassName is not None:
         if subClassName in matchedBufferedClass.innerClasses:
             return matchedBufferedClass.innerClasses[subClassName]
         matchedBufferedClass = None
     editingClass = getClassName(view.file_name())
     if matchedBufferedClass is None and className != editingClass and subClassName is None:
-        return getBufferedClass(view, editingClass + '$' + className)
-    else:
-        return matchedBufferedClass
+        matchedBufferedClass = getBufferedClass(view, editingClass + '$' + className)
+    if matchedBufferedClass is None and missKey is not None:
+        if len(missing_classes) >= 4096:
+            missing_classes.clear()
+        missing_classes[missKey] = lookupGeneration
+    return matchedBufferedClass
+
+def getLookupGeneration():
+    # Changes whenever a class that could not be found before may have appeared
+    with project_index_lock:
+        indexes = tuple((folder, getProjectIndex(folder).generation) for folder in sublime.active_window().folders())
+    return (class_lookup_generation, indexes)
+
+def getArchiveBufferedClass(fileName):
+    archivePath, entryName = fileName.split('!/', 1)
+    try:
+        archiveStat = os.stat(archivePath)
+    except OSError:
+        return None
+    storeKey = ('jar', archivePath, archiveStat.st_mtime, archiveStat.st_size, entryName)
+    bufferedClass = loadStoredClass(storeKey)
+    if bufferedClass is None:
+        try:
+            fileData = zip_file_pool.read(archivePath, entryName).decode('utf-8', 'replace')
+        except Exception as e:
+            print('Java_Autocomplete: could not read source archive', archivePath, e)
+            return None
+        bufferedClass = addBufferedClass(fileName, fileData)
+        saveStoredClass(storeKey, bufferedClass)
+    return bufferedClass
+
+def isClassCurrent(bufferedClass, checkFile = True):
+    # Whether a cached class still matches its open view, or its file when it is not open
+    md = bufferedClass.modifiedDate
+    if md == 0 and bufferedClass.changeCount is None:
+        return True
+    openView = findOpenView(bufferedClass.fileName)
+    if openView is not None:
+        return bufferedClass.changeCount == openView.change_count()
+    if bufferedClass.changeCount is not None:
+        return False
+    return md == 0 or not checkFile or md == os.path.getmtime(bufferedClass.fileName)
+
+def findOpenView(fileName):
+    for window in sublime.windows():
+        view = window.find_open_file(fileName)
+        if view is not None:
+            return view
+    return None
+
+def getViewText(view):
+    while True:
+        changeCount = view.change_count()
+        cached = buffer_texts.get(view.buffer_id())
+        if cached is not None and cached[0] == changeCount:
+            return changeCount, cached[1]
+        text = view.substr(sublime.Region(0, view.size()))
+        if view.change_count() == changeCount:
+            buffer_texts[view.buffer_id()] = (changeCount, text)
+            return changeCount, text
+
+def getViewBufferedClass(view):
+    global class_lookup_generation
+    with buffer_models_lock:
+        changeCount, text = getViewText(view)
+        model = buffer_models.get(view.buffer_id())
+        if model is not None and model.changeCount == changeCount:
+            return model.bufferedClass
+        bufferedClass = None
+        innerClasses = None
+        if model is not None and model.bufferedClass.fileName == view.file_name():
+            innerClasses = model.bufferedClass.innerClasses
+            bufferedClass = reparseBufferModel(model, text)
+        if bufferedClass is None:
+            spans = []
+            bufferedClass = parseBufferedClass(view.file_name(), text, spans)
+            model = BufferModel(changeCount, text, bufferedClass, spans)
+            buffer_models[view.buffer_id()] = model
+        model.changeCount = bufferedClass.changeCount = changeCount
+        model.text = text
+        model.bufferedClass = bufferedClass
+        if innerClasses is None or innerClasses.keys() != bufferedClass.innerClasses.keys():
+            class_lookup_generation += 1
+        cacheBufferedClass(getClassName(view.file_name()), bufferedClass)
+        return bufferedClass
+
+def reparseBufferModel(model, text):
+    # Re-parses only the member declaration that contains the edit
+    begin, oldEnd, newEnd = findChangedRange(model.text, text)
+    spans = model.spans
+    index = bisect.bisect_right([span[0] for span in spans], begin) - 1
+    if index < 0 or oldEnd > spans[index][1]:
+        return None
+    span = spans[index]
+    delta = newEnd - oldEnd
+    trailing = index == len(spans) - 1
+    bufferedClass = copyBufferedClass(model.bufferedClass)
+    for dictName, key in span[2]:
+        getattr(bufferedClass, dictName).pop(key, None)
+    newSpans = []
+    frame = ClassFrame(bufferedClass, getClassName(bufferedClass.fileName))
+    if not scanJavaDeclarations(text, span[0], span[1] + delta, frame, None, newSpans):
+        return None
+    nextSpans = [(start + delta, end + delta, keys) for start, end, keys in spans[index + 1:]]
+    if trailing:
+        newSpans.append((frame.segmentStart, span[1] + delta, []))
+    elif ''.join(frame.pieces).strip() != '':
+        return None
+    elif frame.segmentStart != span[1] + delta:
+        nextSpans[0] = (frame.segmentStart, nextSpans[0][1], nextSpans[0][2])
+    model.spans = spans[:index] + newSpans + nextSpans
+    compactBufferedClass(bufferedClass)
+    return bufferedClass
+
+def findChangedRange(oldText, newText):
+    length = min(len(oldText), len(newText))
+    begin = 0
+    while begin + 4096 <= length and oldText[begin:begin + 4096] == newText[begin:begin + 4096]:
+        begin += 4096
+    while begin < length and oldText[begin] == newText[begin]:
+        begin += 1
+    oldEnd = len(oldText)
+    newEnd = len(newText)
+    while min(oldEnd, newEnd) - 4096 >= begin and oldText[oldEnd - 4096:oldEnd] == newText[newEnd - 4096:newEnd]:
+        oldEnd -= 4096
+        newEnd -= 4096
+    while min(oldEnd, newEnd) > begin and oldText[oldEnd - 1] == newText[newEnd - 1]:
+        oldEnd -= 1
+        newEnd -= 1
+    return begin, oldEnd, newEnd
+
+def copyBufferedClass(bufferedClass):
+    newClass = BufferedClass(bufferedClass.fileName, bufferedClass.modifiedDate)
+    newClass.outerClass = bufferedClass.outerClass
+    newClass.accessModifier = bufferedClass.accessModifier
+    newClass.extends = bufferedClass.extends
+    newClass.typeParameters = bufferedClass.typeParameters
+    newClass.implements = bufferedClass.implements
+    newClass.isInterface = bufferedClass.isInterface
+    newClass.constructors = dict(bufferedClass.constructors)
+    newClass.methods = dict(bufferedClass.methods)
+    newClass.fields = dict(bufferedClass.fields)
+    newClass.staticMethods = dict(bufferedClass.staticMethods)
+    newClass.staticFields = dict(bufferedClass.staticFields)
+    newClass.innerClasses = dict(bufferedClass.innerClasses)
+    return newClass
+
+def prefetchClasses(view):
+    global prefetch_executor
+    if prefetch_executor is None:
+        prefetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers = prefetch_workers)
+    prefetch_executor.submit(prefetchClassChain, view, getClassName(view.file_name()))
+    for region in view.find_all(r'^import\s+[\w.]+\s*;'):
+        className = view.substr(region)[6:].strip(' \t;')
+        className = className[className.rfind('.') + 1:]
+        if className in class_cache:
+            continue
+        prefetch_executor.submit(prefetchClassChain, view, className)
+
+def prefetchClassChain(view, className):
+    try:
+        for i in range(16):
+            bufferedClass = getBufferedClass(view, className)
+            if bufferedClass is None or bufferedClass.extends is None:
+                return
+            className = bufferedClass.extends
+    except Exception as e:
+        print('Java_Autocomplete: could not prefetch', className, e)
 
 def addBufferedClass(fileName, fileData):
-    className = getClassName(fileName)
+    bufferedClass = parseBufferedClass(fileName, fileData)
+    if '$' not in fileName:
+        cacheBufferedClass(getClassName(fileName), bufferedClass)
+    return bufferedClass
+
+@timedStage('parse')
+def parseBufferedClass(fileName, fileData, spans = None):
+    countStat('classesParsed')
+    countStat('bytesParsed', len(fileData))
     if os.path.isfile(fileName):
         bufferedClass = BufferedClass(fileName, os.path.getmtime(fileName))
     else:
         bufferedClass = BufferedClass(fileName, 0)
-    if '$' in fileName:
-        bufferedClass.outerClass = fileName[:fileName.find('$')]
-    for match in java_comment_pattern.finditer(fileData):
-        group0 = match.group(0)
-        group1 = match.group(1)
-        group2 = match.group(2)
-        if group1 is not None or group2 is not None:
+    scanJavaDeclarations(fileData, 0, len(fileData), ClassFrame(None, None), bufferedClass, spans)
+    compactBufferedClass(bufferedClass)
+    return bufferedClass
+
+def compactBufferedClass(bufferedClass):
+    # Classes without some kind of member share one read-only empty mapping
+    for name in ('constructors', 'methods', 'fields', 'staticMethods', 'staticFields', 'innerClasses'):
+        if len(getattr(bufferedClass, name)) == 0:
+            setattr(bufferedClass, name, empty_members)
+    for innerClass in bufferedClass.innerClasses.values():
+        compactBufferedClass(innerClass)
+
+def scanJavaDeclarations(fileData, start, end, rootFrame, fileClass, spans):
+    # Walks the comments, literals and braces once, collecting the text of
+    # every declaration at class body level and skipping member bodies
+    frame = rootFrame
+    frame.segmentStart = start
+    spansFrame = rootFrame if fileClass is None else None
+    mainFrame = None
+    depth = 0
+    last = start
+    for token in java_token_pattern.finditer(fileData, start, end):
+        tokenStart = token.start()
+        collecting = depth == frame.level
+        if collecting:
+            frame.pieces.append(fileData[last:tokenStart])
+        last = token.end()
+        c = fileData[tokenStart]
+        if c == '/':
+            if token.group() == '/*':
+                return False
             continue
-        fileData = fileData.replace(group0, '', 1)
-    innerClasses = java_class_pattern.finditer(fileData)
-    next(innerClasses)
-    for innerClass in innerClasses:
-        fullGroup = innerClass.group()
-        if len(fullGroup) == 0:
+        if c == '"' or c == "'":
+            if collecting:
+                frame.pieces.append(token.group())
             continue
-        innerClassName = innerClass.group(4)
-        indexofInner = fileData.find(fullGroup)
-        indexofBracket = fileData.find('{', indexofInner)
-        foundBracket = findEndBracket(fileData, indexofBracket, '{}')
-        if foundBracket == -1:
+        if not collecting:
+            if c == '{':
+                depth += 1
+            elif c == '}':
+                depth -= 1
+                if depth == frame.level:
+                    if frame.blockIsMember:
+                        finishClassMember(frame, frame.memberKeys, last, spansFrame, spans)
+                    else:
+                        frame.pieces.append('{}')
             continue
-        innerClass = fileData[indexofInner:foundBracket + 1]
-        fileName = className + '$' + innerClassName
-        bufferedClass.innerClasses[innerClassName] = addBufferedClass(fileName, innerClass)
-        fileData = fileData[:indexofInner] + fileData[foundBracket + 1:]
-    classInfo = java_class_pattern.search(fileData)
-    if classInfo is not None:
-        bufferedClass.accessModifier = classInfo.group(1)
-        bufferedClass.extends = classInfo.group(5)
-    cr = '(?:(protected|public|default)\s+)(' + re.escape(className) + ')\s*\(\s*([^\)]*)\s*\)';
-    while True:
-        constructor = re.search(cr, fileData)
-        if constructor is None:
-            break
-        fullGroup = constructor.group()
-        if len(fullGroup) == 0:
-            break
-        constructorName = constructor.group(2)
-        constructorArgs = constructor.group(3)
-        constructorArgs = constructorArgs.replace('\n', '')
-        constructorArgs = constructorArgs.replace('\r', '')
-        constructorArgs = re.sub('\s\s+', ' ', constructorArgs)
-        fullName = constructorName + '(' + constructorArgs + ')'
+        if c == ';':
+            keys = []
+            if frame.bufferedClass is not None:
+                frame.pieces.append(';')
+                keys = addClassMember(frame, ''.join(frame.pieces), False)
+            finishClassMember(frame, keys, last, spansFrame, spans)
+        elif c == '{':
+            header = ''.join(frame.pieces)
+            classInfo = java_class_pattern.search(header)
+            depth += 1
+            if classInfo is None:
+                frame.memberKeys = []
+                if frame.bufferedClass is not None:
+                    frame.memberKeys = addClassMember(frame, header, True)
+                frame.blockIsMember = len(frame.memberKeys) > 0 or frame.bufferedClass is None
+                continue
+            if frame is rootFrame and fileClass is not None and mainFrame is None:
+                fileClass.accessModifier = classInfo.group(1)
+                setClassHeader(fileClass, header, classInfo)
+                mainFrame = ClassFrame(fileClass, getClassName(fileClass.fileName))
+                mainFrame.owner = None
+                newFrame = spansFrame = mainFrame
+            else:
+                owner = frame if frame.bufferedClass is not None else mainFrame
+                innerClassName = classInfo.group(4)
+                innerFileName = owner.className + '$' + innerClassName
+                innerClass = BufferedClass(innerFileName, 0)
+                innerClass.outerClass = innerFileName[:innerFileName.find('$')]
+                innerClass.accessModifier = classInfo.group(1)
+                setClassHeader(innerClass, header, classInfo)
+                newFrame = ClassFrame(innerClass, getClassName(innerFileName))
+                newFrame.owner = owner
+                newFrame.innerClassName = innerClassName
+            newFrame.parent = frame
+            newFrame.level = depth
+            newFrame.segmentStart = last
+            frame = newFrame
+        else:
+            if frame is rootFrame:
+                if fileClass is None:
+                    return False
+                continue
+            if frame is spansFrame and spans is not None:
+                spans.append((frame.segmentStart, tokenStart, []))
+            depth -= 1
+            keys = []
+            if frame.owner is not None:
+                frame.owner.bufferedClass.innerClasses[frame.innerClassName] = frame.bufferedClass
+                keys = [('innerClasses', frame.innerClassName)]
+            frame = frame.parent
+            finishClassMember(frame, keys, last, spansFrame, spans)
+    if depth == frame.level:
+        frame.pieces.append(fileData[last:end])
+    return frame is rootFrame and depth == rootFrame.level
+
+def setClassHeader(bufferedClass, header, classInfo):
+    # Type parameters and the full supertypes, class Foo<K, V extends Bar<K>> extends Base<Map<K, V>>
+    # The class pattern stops inside bounded type parameters, so the supertypes are read after their end
+    bufferedClass.isInterface = classInfo.group(3) == 'interface'
+    nameEnd = findGenericTypeEnd(header, classInfo.start(4))
+    extends = java_extends_pattern.match(header, nameEnd)
+    if extends is not None:
+        supertypes = readGenericTypes(header, extends.end())
+        bufferedClass.extends = supertypes[0] if len(supertypes) > 0 else None
+        # An interface can extend several interfaces, the ones after the first are kept with the implemented ones
+        if bufferedClass.isInterface:
+            bufferedClass.implements = tuple(supertypes[1:])
+    implements = java_implements_pattern.search(header, nameEnd)
+    if implements is not None:
+        bufferedClass.implements += tuple(readGenericTypes(header, implements.end()))
+    typeParameters = splitTypeArguments(header[classInfo.start(4):nameEnd].strip())[1]
+    bufferedClass.typeParameters = tuple(java_type_name_pattern.match(parameter).group()
+            for parameter in typeParameters if java_type_name_pattern.match(parameter))
+
+def finishClassMember(frame, keys, end, spansFrame, spans):
+    if spans is not None and frame is spansFrame:
+        spans.append((frame.segmentStart, end, keys))
+    frame.pieces = []
+    frame.segmentStart = end
+
+def addClassMember(frame, header, hasBody):
+    bufferedClass = frame.bufferedClass
+    keys = []
+    constructor = frame.constructorPattern.search(header)
+    if constructor is not None:
+        constructorArgs = normalizeMethodArgs(constructor.group(3))
+        fullName = constructor.group(2) + '(' + constructorArgs + ')'
         bufferedClass.constructors[fullName] = constructorArgs
-        constructorPos = fileData.find(constructor.group())
-        bracketStartPos = fileData.find('{', constructorPos)
-        if bracketStartPos == -1:
-            fileData = fileData[:constructorPos] + fileData[constructorPos + len(fullGroup) + 1:]
-            continue
-        bracketEndPos = findEndBracket(fileData, bracketStartPos, '{}')
-        if bracketEndPos == -1:
-            fileData = fileData[:constructorPos] + fileData[constructorPos + len(fullGroup) + 1:]
-            continue
-        fileData = fileData[:constructorPos] + fileData[bracketEndPos + 1:]
-    while True:
-        method = java_method_pattern.search(fileData)
-        if method is None:
-            break
-        fullGroup = method.group()
-        if len(fullGroup) == 0:
-            break
+        keys.append(('constructors', fullName))
+        return keys
+    method = java_method_pattern.search(header)
+    if method is None and bufferedClass.isInterface:
+        method = java_interface_method_pattern.search(header)
+    if method is not None:
         methodName = method.group(4)
-        methodArgs = method.group(5)
-        methodArgs = methodArgs.replace('\n', '')
-        methodArgs = methodArgs.replace('\r', '')
-        methodArgs = re.sub('\s\s+', ' ', methodArgs)
+        methodArgs = normalizeMethodArgs(method.group(5))
         fullName = methodName + '(' + methodArgs + ')'
-        keywords = method.group(2).strip()
-        if 'static' in keywords:
+        if 'static' in method.group(2):
             bufferedClass.staticMethods[fullName] = ClassMethod(methodName, method.group(3), methodArgs)
+            keys.append(('staticMethods', fullName))
         else:
             bufferedClass.methods[fullName] = ClassMethod(methodName, method.group(3), methodArgs)
-        methodPos = fileData.find(fullGroup)
-        if 'abstract' in keywords:
-            semicolonPos = fileData.find(';', methodPos)
-            if semicolonPos == -1:
-                fileData = fileData[:methodPos] + fileData[methodPos + len(fullGroup) + 1:]
-                continue
-            fileData = fileData[:methodPos] + fileData[semicolonPos + 1:]
-        else:
-            bracketStartPos = fileData.find('{', methodPos)
-            if bracketStartPos == -1:
-                fileData = fileData[:methodPos] + fileData[methodPos + len(fullGroup) + 1:]
-                continue
-            bracketEndPos = findEndBracket(fileData, bracketStartPos, '{}')
-            if bracketEndPos == -1:
-                fileData = fileData[:methodPos] + fileData[methodPos + len(fullGroup) + 1:]
+            keys.append(('methods', fullName))
+        return keys
+    if hasBody:
+        return keys
+    # Interface members are public without saying so and interface fields are constants
+    fieldPattern = java_interface_field_pattern if bufferedClass.isInterface else java_field_pattern
+    for field in fieldPattern.finditer(header):
+        keywords = field.group(2)
+        type = sys.intern(field.group(3))
+        for fieldName in java_field_names_pattern.finditer(field.group()):
+            name = sys.intern(fieldName.group(1))
+            if 'static' in keywords or bufferedClass.isInterface:
+                bufferedClass.staticFields[name] = type
+                keys.append(('staticFields', name))
+            else:
+                bufferedClass.fields[name] = type
+                keys.append(('fields', name))
+    return keys
+
+def normalizeMethodArgs(args):
+    args = args.replace('\n', '')
+    args = args.replace('\r', '')
+    return re.sub('\s\s+', ' ', args)
+
+def cacheBufferedClass(className, bufferedClass):
+    class_cache.put(className, bufferedClass, estimateClassSize(bufferedClass))
+
+def estimateClassSize(bufferedClass):
+    size = 512
+    for members in (bufferedClass.constructors, bufferedClass.methods, bufferedClass.fields,
+            bufferedClass.staticMethods, bufferedClass.staticFields):
+        for key in members.keys():
+            size += 160 + 2 * len(key)
+    for innerClass in bufferedClass.innerClasses.values():
+        size += estimateClassSize(innerClass)
+    return size
+
+def pinClassHierarchy(view):
+    classNames = set()
+    className = getClassName(view.file_name())
+    for i in range(16):
+        bufferedClass = getBufferedClass(view, className)
+        if bufferedClass is None:
+            break
+        classNames.add(getClassName(bufferedClass.fileName))
+        if bufferedClass.extends is None:
+            break
+        className = bufferedClass.extends
+    class_cache.pin(classNames)
+
+def getClassStorePath(storeKey = None):
+    path = os.path.join(sublime.cache_path(), 'Java-AutoComplete', 'classes')
+    if storeKey is None:
+        return path
+    keyHash = hashlib.sha1(repr(storeKey).encode('utf-8')).hexdigest()
+    return os.path.join(path, keyHash + '.pickle')
+
+@timedStage('loadStoredClass')
+def loadStoredClass(storeKey):
+    if not class_disk_cache:
+        return None
+    storePath = getClassStorePath(storeKey)
+    try:
+        with open(storePath, 'rb') as f:
+            version, key, data = pickle.load(f)
+        os.utime(storePath, None)
+    except Exception:
+        countStat('storeMisses')
+        return None
+    if version != class_store_version or key != storeKey:
+        countStat('storeMisses')
+        return None
+    countStat('storeHits')
+    bufferedClass = bufferedClassFromData(data)
+    cacheBufferedClass(getClassName(bufferedClass.fileName), bufferedClass)
+    return bufferedClass
+
+def saveStoredClass(storeKey, bufferedClass):
+    if not class_disk_cache or bufferedClass is None:
+        return
+    data = bufferedClassToData(bufferedClass)
+    sublime.set_timeout_async(lambda: writeStoredClass(storeKey, data), 0)
+
+def writeStoredClass(storeKey, data):
+    storePath = getClassStorePath(storeKey)
+    try:
+        if not os.path.isdir(os.path.dirname(storePath)):
+            os.makedirs(os.path.dirname(storePath))
+        with open(storePath + '.tmp', 'wb') as f:
+            pickle.dump((class_store_version, storeKey, data), f, 2)
+        os.replace(storePath + '.tmp', storePath)
+    except Exception as e:
+        print('Java_Autocomplete: could not store class', e)
+
+def bulkIndexClasses(window):
+    global bulk_index_running
+    try:
+        sources = []
+        with project_index_lock:
+            for folder in window.folders():
+                sources.extend(('file', fileName) for fileName in getProjectIndex(folder).filePaths.values())
+        if bulk_index_java_library:
+            loadJavaZip()
+            if java_zip_archive is not None:
+                sources.extend(('zip', fileName) for fileName in java_zip_file_names
+                        if fileName.endswith('.java') and not fileName.endswith('-info.java'))
+        # Only classes without a current store entry go to the workers
+        pending = []
+        for kind, fileName in sources:
+            try:
+                if kind == 'file':
+                    fileStat = os.stat(fileName)
+                    storeKey = ('file', fileName, fileStat.st_mtime, fileStat.st_size)
+                else:
+                    storeKey = ('zip', java_zip_archive.filename, fileName, java_zip_archive.getinfo(fileName).CRC)
+            except Exception as e:
+                print('Java_Autocomplete: could not index', fileName, e)
                 continue
-            fileData = fileData[:methodPos] + fileData[bracketEndPos + 1:]
-    fields = java_field_pattern.finditer(fileData)
-    for field in fields:
-        keywords = field.group(2).strip()
-        type = field.group(3)
-        fieldNames = java_field_names_pattern.finditer(field.group())
-        for fieldName in fieldNames:
-            if 'static' in keywords:
-                bufferedClass.staticFields[fieldName.group(1)] = type
+            if not os.path.isfile(getClassStorePath(storeKey)):
+                pending.append((kind, fileName, storeKey))
+        # Batches keep the per-task overhead low, the store write happens in the worker
+        batches = [pending[i:i + 32] for i in range(0, len(pending), 32)]
+        done = 0
+        parsed = 0
+        lastProgress = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers = max(bulk_index_workers, 1)) as executor:
+            for batch, (batchParsed, failures) in zip(batches, executor.map(indexClassBatch, batches)):
+                done += len(batch)
+                parsed += batchParsed
+                for fileName, e in failures:
+                    print('Java_Autocomplete: could not index', fileName, e)
+                if time.time() - lastProgress >= 0.25:
+                    lastProgress = time.time()
+                    showIndexProgress(window, 'Java index: %d/%d classes' % (done, len(pending)))
+        showIndexProgress(window, None)
+        sublime.status_message('Java_Autocomplete: indexed %d classes, parsed %d' % (len(sources), parsed))
+    finally:
+        with completions_lock:
+            bulk_index_running = False
+
+def indexClassBatch(batch):
+    # (classes parsed, [(file name, error)]), the coordinator reports the failures
+    parsed = 0
+    failures = []
+    for kind, fileName, storeKey in batch:
+        try:
+            if kind == 'file':
+                with open(fileName, 'r') as f:
+                    fileData = f.read()
             else:
-                bufferedClass.fields[fieldName.group(1)] = type
-    if '$' not in fileName:
-        class_cache[className] = bufferedClass
-        if len(class_cache) > class_cache_size:
-            class_cache.popitem(False)
+                with java_zip_lock:
+                    with java_zip_archive.open(fileName, 'r') as f:
+                        fileData = f.read().decode('utf-8').replace('\\n', '\n')
+            writeStoredClass(storeKey, bufferedClassToData(parseBufferedClass(fileName, fileData)))
+            parsed += 1
+        except Exception as e:
+            failures.append((fileName, e))
+    return parsed, failures
+
+def showIndexProgress(window, message):
+    def show():
+        if message is None:
+            for view in window.views():
+                view.erase_status('java_autocomplete_index')
+            return
+        view = window.active_view()
+        if view is not None:
+            view.set_status('java_autocomplete_index', message)
+    sublime.set_timeout(show, 0)
+
+def pruneClassStore():
+    path = getClassStorePath()
+    if not os.path.isdir(path):
+        return
+    oldest = time.time() - class_disk_cache_max_age * 86400
+    for fileName in os.listdir(path):
+        fileName = os.path.join(path, fileName)
+        try:
+            if os.path.getmtime(fileName) < oldest:
+                os.remove(fileName)
+        except OSError:
+            pass
+
+def bufferedClassToData(bufferedClass):
+    methods = {}
+    for key, value in bufferedClass.methods.items():
+        methods[key] = (value.name, value.type, value.args)
+    staticMethods = {}
+    for key, value in bufferedClass.staticMethods.items():
+        staticMethods[key] = (value.name, value.type, value.args)
+    innerClasses = {}
+    for key, value in bufferedClass.innerClasses.items():
+        innerClasses[key] = bufferedClassToData(value)
+    return (bufferedClass.fileName, bufferedClass.modifiedDate, bufferedClass.outerClass,
+            bufferedClass.accessModifier, bufferedClass.extends, dict(bufferedClass.constructors),
+            methods, dict(bufferedClass.fields), staticMethods, dict(bufferedClass.staticFields), innerClasses,
+            bufferedClass.typeParameters, bufferedClass.implements, bufferedClass.isInterface)
+
+def bufferedClassFromData(data):
+    bufferedClass = BufferedClass(data[0], data[1])
+    bufferedClass.outerClass = data[2]
+    bufferedClass.accessModifier = data[3]
+    bufferedClass.extends = data[4]
+    bufferedClass.constructors = data[5]
+    for key, value in data[6].items():
+        bufferedClass.methods[key] = ClassMethod(value[0], value[1], value[2])
+    for key, value in data[7].items():
+        bufferedClass.fields[sys.intern(key)] = sys.intern(value)
+    for key, value in data[8].items():
+        bufferedClass.staticMethods[key] = ClassMethod(value[0], value[1], value[2])
+    for key, value in data[9].items():
+        bufferedClass.staticFields[sys.intern(key)] = sys.intern(value)
+    for key, value in data[10].items():
+        bufferedClass.innerClasses[key] = bufferedClassFromData(value)
+    bufferedClass.typeParameters = data[11]
+    bufferedClass.implements = data[12]
+    bufferedClass.isInterface = data[13]
+    compactBufferedClass(bufferedClass)
     return bufferedClass
 
 def checkImport(view, line):
     if line.startswith('import '):
-        input = view.substr(view.word(view.sel()[0].end()))
-        input = line[7:].replace('.', '/')
-        partialClasses = findClasses(input, False)
+        input = line[7:].strip().rstrip(';')
+        if input.startswith('static '):
+            return
+        partialClasses, packages = findImports(input)
+        importCompletions = []
+        for package in packages:
+            importCompletions.append((package + '*\tpackage', package + '*;'))
         for partialClass in partialClasses:
-            partialClass = partialClass.replace('\\', '/')[partialClass.find('/') + 1:-5].replace('/', '.')
             name = partialClass
             path = ''
             if '.' in name:
                 path = name[:name.rfind('.')]
                 name = name[name.rfind('.') + 1:]
-            generalCompletions.append((name + '\t' + path, partialClass + ';'))
+            importCompletions.append((name + '\t' + path, partialClass + ';'))
+        with completions_lock:
+            generalCompletions.extend(importCompletions)
 
 def getClassName(fileName):
     if fileName.rfind('/') != -1:
@@ -0,0 +1,106 @@
+# Synthetic Java sources for the benchmarks, the same seed always gives the same corpus
+
+import os
+import random
+import zipfile
+
+types = ['int', 'long', 'boolean', 'double[]', 'String', 'Object', 'List<String>', 'Map<String, Integer>',
+        'Set<Long>', 'Optional<String>']
+modifiers = ['public', 'public', 'protected', 'private', 'public static', 'public final', 'public synchronized']
+words = ['account', 'buffer', 'cache', 'delta', 'entry', 'factory', 'group', 'handler', 'index', 'job',
+        'key', 'listener', 'manager', 'node', 'order', 'parser', 'query', 'record', 'session', 'token']
+
+def randomName(r, capitalize = False):
+    name = r.choice(words) + r.choice(words).capitalize()
+    if capitalize:
+        return name.capitalize()
+    return name
+
+def randomArgs(r):
+    return ', '.join('%s %s%d' % (r.choice(types), r.choice(words), i) for i in range(r.randint(0, 4)))
+
+def javaMethod(r, index, indent):
+    lines = []
+    lines.append(indent + '/**')
+    lines.append(indent + ' * Computes the { braced } "value" of public void notAMethod(int x) {}')
+    lines.append(indent + ' */')
+    name = '%s%d' % (randomName(r), index)
+    lines.append('%s%s %s %s(%s) {' % (indent, r.choice(modifiers), r.choice(types + ['void']), name, randomArgs(r)))
+    for i in range(r.randint(1, 6)):
+        lines.append('%s    if (count > %d) { label = "%s{"; } // %s }' % (indent, i, r.choice(words), r.choice(words)))
+    if r.random() < 0.2:
+        lines.append(indent + '    Runnable task = new Runnable() { public void run() { count++; } };')
+    lines.append(indent + '    return;')
+    lines.append(indent + '}')
+    return lines
+
+def javaClass(r, packageName, className, superClass, memberCount, nested = True):
+    lines = ['package %s;' % packageName, '', 'import java.util.*;', '']
+    lines.extend(javaClassBody(r, className, superClass, memberCount, nested, ''))
+    return '\n'.join(lines) + '\n'
+
+def javaClassBody(r, className, superClass, memberCount, nested, indent):
+    lines = []
+    header = '%spublic class %s' % (indent, className)
+    if superClass is not None:
+        header += ' extends ' + superClass
+    lines.append(header + ' {')
+    for i in range(memberCount):
+        k = r.random()
+        if k < 0.3:
+            lines.append('%s    %s %s %s%d = %d;' % (indent, r.choice(modifiers), r.choice(types), r.choice(words), i, i))
+        elif k < 0.35:
+            lines.append('%s    public %s(%s) {' % (indent, className, randomArgs(r)))
+            lines.append(indent + '        super();')
+            lines.append(indent + '    }')
+        else:
+            lines.extend(javaMethod(r, i, indent + '    '))
+        if nested and r.random() < 0.02:
+            inner = javaClassBody(r, className + 'Part%d' % i, None, 6, False, indent + '    ')
+            inner[0] = inner[0].replace('public class', 'public static class', 1)
+            lines.extend(inner)
+    lines.append(indent + '}')
+    return lines
+
+def writeProject(directory, classCount, seed = 1):
+    # A chain of base classes for inherited members, then classes spread over packages that extend them
+    r = random.Random(seed)
+    classNames = []
+    chain = ['BenchBase%d' % level for level in range(6)]
+    for level, className in enumerate(chain):
+        superClass = chain[level - 1] if level > 0 else None
+        writeClass(directory, 'com.bench.core', className, javaClass(r, 'com.bench.core', className, superClass, 40))
+        classNames.append(className)
+    for i in range(classCount):
+        packageName = 'com.bench.p%d' % (i % 16)
+        className = '%s%d' % (randomName(r, True), i)
+        superClass = r.choice(chain) if r.random() < 0.6 else None
+        memberCount = r.choice([10, 20, 40, 80, 200])
+        writeClass(directory, packageName, className, javaClass(r, packageName, className, superClass, memberCount))
+        classNames.append(className)
+    return classNames
+
+def writeClass(directory, packageName, className, source):
+    packageDirectory = os.path.join(directory, 'src', *packageName.split('.'))
+    if not os.path.isdir(packageDirectory):
+        os.makedirs(packageDirectory)
+    with open(os.path.join(packageDirectory, className + '.java'), 'w') as f:
+        f.write(source)
+
+def writeSourceZip(fileName, classCount, seed = 2):
+    # Laid out like a JDK 9+ src.zip: module/package/Class.java
+    r = random.Random(seed)
+    modules = ['java.base', 'java.desktop', 'java.sql', 'java.xml', 'jdk.compiler']
+    packages = ['java/util', 'java/util/concurrent', 'java/io', 'java/lang', 'java/nio/file', 'javax/swing',
+            'java/sql', 'org/w3c/dom', 'com/sun/tools/javac']
+    classNames = []
+    with zipfile.ZipFile(fileName, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(classCount):
+            packagePath = r.choice(packages)
+            className = '%s%d' % (randomName(r, True), i)
+            packageName = packagePath.replace('/', '.')
+            memberCount = r.choice([5, 10, 20, 40])
+            source = javaClass(r, packageName, className, None, memberCount, False)
+            archive.writestr('%s/%s/%s.java' % (r.choice(modules), packagePath, className), source)
+            classNames.append(className)
+    return classNames
@@ -0,0 +1,247 @@
+# Headless microbenchmarks for the parser, class lookups and completion building.
+#
+#   python benchmarks/run.py            run and compare with benchmarks/baseline.json if it exists
+#   python benchmarks/run.py --save     run and store the results as the new baseline
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmark_directory)
+sys.path.insert(1, os.path.dirname(benchmark_directory))
+
+import sublime
+import autocomplete
+import corpus
+
+class Context:
+    def __init__(self, directory, classCount, zipClassCount, repeat, nameFilter):
+        self.directory = directory
+        self.repeat = repeat
+        self.nameFilter = nameFilter
+        self.results = {}
+        self.projectDirectory = os.path.join(directory, 'project')
+        self.classNames = corpus.writeProject(self.projectDirectory, classCount)
+        jdkDirectory = os.path.join(directory, 'jdk')
+        os.makedirs(os.path.join(jdkDirectory, 'bin'))
+        open(os.path.join(jdkDirectory, 'bin', 'javac'), 'w').close()
+        self.zipClassNames = corpus.writeSourceZip(os.path.join(jdkDirectory, 'src.zip'), zipClassCount)
+        self.sources = []
+        for directory, subdirectories, fileNames in os.walk(self.projectDirectory):
+            for fileName in sorted(fileNames):
+                fileName = os.path.join(directory, fileName)
+                with open(fileName, 'r') as f:
+                    self.sources.append((fileName, f.read()))
+        self.sources.sort()
+        sublime.cache_directory = os.path.join(self.directory, 'cache')
+        window = sublime.Window([self.projectDirectory])
+        sublime.open_windows[:] = [window]
+        self.view = sublime.View(os.path.join(self.projectDirectory, 'src', 'Editing.java'), '', window)
+        autocomplete.java_library_path = os.path.join(jdkDirectory, 'bin', 'javac')
+        autocomplete.class_disk_cache = False
+        autocomplete.source_archive_discovery = False
+        autocomplete.prefetch_imports = False
+
+    def measure(self, name, operation, count, bytesPerOperation = None):
+        if self.nameFilter in name:
+            self.results[name] = measure(operation, count, self.repeat, bytesPerOperation)
+
+def measure(operation, count, repeat, bytesPerOperation = None):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(count):
+            operation(i * count + j)
+        samples.append((time.perf_counter() - start) / count)
+    samples.sort()
+    result = {
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+    }
+    result['opsPerSecond'] = 1 / result['p50'] if result['p50'] > 0 else 0
+    if bytesPerOperation is not None:
+        result['mbPerSecond'] = bytesPerOperation / result['p50'] / 1024 / 1024
+    return result
+
+def benchmarkParsing(context):
+    for label, minSize, maxSize in (('small', 0, 8192), ('large', 32768, None)):
+        sources = [source for source in context.sources
+                if len(source[1]) >= minSize and (maxSize is None or len(source[1]) < maxSize)][:40]
+        if len(sources) == 0:
+            continue
+        averageSize = sum(len(source[1]) for source in sources) / len(sources)
+        def parse(i):
+            fileName, text = sources[i % len(sources)]
+            autocomplete.addBufferedClass(fileName, text)
+        context.measure('addBufferedClass/' + label, parse, len(sources), averageSize)
+
+def benchmarkProjectLookups(context):
+    r = random.Random(3)
+    classNames = [r.choice(context.classNames) for i in range(64)]
+    autocomplete.getProjectIndex(context.projectDirectory)
+    def exact(i):
+        autocomplete.findClassesFromIndex(context.projectDirectory, classNames[i % len(classNames)], True)
+    def partial(i):
+        autocomplete.findClassesFromIndex(context.projectDirectory, classNames[i % len(classNames)][:5], False)
+    context.measure('findClassesFromIndex/exact', exact, 64)
+    context.measure('findClassesFromIndex/partial', partial, 64)
+
+def benchmarkClassResolution(context):
+    # findClass with a view resolves through the file's package and imports before searching
+    window = sublime.open_windows[0]
+    fileName = os.path.join(context.projectDirectory, 'src', 'com', 'bench', 'p3', 'Resolving.java')
+    view = sublime.View(fileName, 'package com.bench.p3;\n\nimport com.bench.core.*;\nimport com.bench.p5.*;\n', window)
+    imported = []
+    for fileName, text in context.sources:
+        if 'package com.bench.p3;' in text or 'package com.bench.p5;' in text or 'package com.bench.core;' in text:
+            imported.append(autocomplete.getClassName(fileName))
+    def resolved(i):
+        autocomplete.findClass(imported[i % len(imported)], True, view)
+    def missing(i):
+        autocomplete.findClass('Missing%d' % (i % 64), True, view)
+    context.measure('findClass/view', resolved, 64)
+    context.measure('findClass/missing', missing, 64)
+
+def benchmarkZipLookups(context):
+    autocomplete.loadJavaZip()
+    r = random.Random(4)
+    classNames = [r.choice(context.zipClassNames) for i in range(64)]
+    def exact(i):
+        autocomplete.findClassesFromZip(classNames[i % len(classNames)], True)
+    def partial(i):
+        autocomplete.findClassesFromZip(classNames[i % len(classNames)][:6], False)
+    def path(i):
+        autocomplete.findClassesFromZip('util/concurrent/' + classNames[i % len(classNames)][:4], False)
+    context.measure('findClassesFromZip/exact', exact, 64)
+    context.measure('findClassesFromZip/partial', partial, 64)
+    context.measure('findClassesFromZip/path', path, 64)
+
+def findSubclasses(context):
+    subclasses = []
+    for fileName, text in context.sources:
+        if ' extends BenchBase5 ' in text:
+            subclasses.append(autocomplete.getClassName(fileName))
+    return subclasses[:16]
+
+def memberKeys(bufferedClass):
+    # Field names and method calls such as name(2) as a member chain has them
+    keys = []
+    for key in autocomplete.getMemberIndex(bufferedClass):
+        if isinstance(key, str):
+            keys.append(key)
+        elif key[1] is not None:
+            keys.append('%s(%d)' % key)
+    return sorted(keys)
+
+def benchmarkMemberLookups(context):
+    view = context.view
+    subclasses = findSubclasses(context)
+    base = autocomplete.getBufferedClass(view, 'BenchBase0')
+    inherited = memberKeys(base)[:32]
+    own = []
+    for className in subclasses:
+        own.extend((className, key) for key in memberKeys(autocomplete.getBufferedClass(view, className))[:4])
+    def ownMember(i):
+        className, key = own[i % len(own)]
+        autocomplete.findKeyType(view, className, key)
+    def inheritedMember(i):
+        autocomplete.findKeyType(view, subclasses[i % len(subclasses)], inherited[i % len(inherited)])
+    def missingMember(i):
+        autocomplete.findKeyType(view, subclasses[i % len(subclasses)], 'missing%d' % (i % 64))
+    context.measure('findKeyType/own', ownMember, 64)
+    context.measure('findKeyType/inherited', inheritedMember, 64)
+    context.measure('findKeyType/missing', missingMember, 64)
+
+def benchmarkCompletions(context):
+    view = context.view
+    classes = [autocomplete.getBufferedClass(view, className) for className in findSubclasses(context)]
+    def warm(i):
+        autocomplete.addClassCompletions(view, classes[i % len(classes)], False, autocomplete.CompletionLists())
+    def cold(i):
+        bufferedClass = classes[i % len(classes)]
+        for ancestor in [bufferedClass] + autocomplete.getClassAncestors(view, bufferedClass):
+            ancestor.completions = None
+            ancestor.ownCompletions = None
+        autocomplete.addClassCompletions(view, bufferedClass, False, autocomplete.CompletionLists())
+    context.measure('addClassCompletions/warm', warm, 32)
+    context.measure('addClassCompletions/cold', cold, 8)
+
+def benchmarkMethodArgs(context):
+    args = []
+    for fileName, text in context.sources[:40]:
+        bufferedClass = autocomplete.addBufferedClass(fileName, text)
+        for method in bufferedClass.methods.values():
+            args.append(method.args)
+    def complete(i):
+        autocomplete.methodArgsToCompletion(args[i % len(args)])
+    context.measure('methodArgsToCompletion', complete, 512)
+
+benchmarks = [benchmarkParsing, benchmarkProjectLookups, benchmarkClassResolution, benchmarkZipLookups,
+        benchmarkMemberLookups, benchmarkCompletions, benchmarkMethodArgs]
+
+def formatTime(seconds):
+    if seconds >= 0.001:
+        return '%.2fms' % (seconds * 1000)
+    return '%.1fus' % (seconds * 1000000)
+
+def report(results, baseline, threshold):
+    regressions = []
+    print('%-30s %12s %10s %10s %9s  %s' % ('benchmark', 'ops/s', 'p50', 'p95', 'MB/s', 'vs baseline'))
+    for name in sorted(results.keys()):
+        result = results[name]
+        comparison = ''
+        if baseline is not None and name in baseline:
+            change = result['p50'] / baseline[name]['p50'] - 1
+            comparison = '%+.1f%%' % (change * 100)
+            if change > threshold:
+                comparison += ' REGRESSION'
+                regressions.append(name)
+        mbPerSecond = ''
+        if 'mbPerSecond' in result:
+            mbPerSecond = '%.2f' % result['mbPerSecond']
+        print('%-30s %12.0f %10s %10s %9s  %s' % (name, result['opsPerSecond'], formatTime(result['p50']),
+                formatTime(result['p95']), mbPerSecond, comparison))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the Java autocomplete engine without Sublime Text.')
+    parser.add_argument('--baseline', default = os.path.join(benchmark_directory, 'baseline.json'))
+    parser.add_argument('--save', action = 'store_true', help = 'store the results as the new baseline')
+    parser.add_argument('--threshold', type = float, default = 0.2, help = 'slowdown reported as a regression')
+    parser.add_argument('--classes', type = int, default = 400, help = 'classes in the synthetic project')
+    parser.add_argument('--zip-classes', type = int, default = 4000, help = 'classes in the synthetic src.zip')
+    parser.add_argument('--repeat', type = int, default = 20)
+    parser.add_argument('--filter', default = '', help = 'only run benchmarks containing this text')
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix = 'java-autocomplete-benchmarks-')
+    try:
+        context = Context(directory, arguments.classes, arguments.zip_classes, arguments.repeat, arguments.filter)
+        for benchmark in benchmarks:
+            autocomplete.class_cache.clear()
+            benchmark(context)
+        results = context.results
+    finally:
+        shutil.rmtree(directory, ignore_errors = True)
+
+    baseline = None
+    if os.path.isfile(arguments.baseline) and not arguments.save:
+        with open(arguments.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+    regressions = report(results, baseline, arguments.threshold)
+    if arguments.save:
+        with open(arguments.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent = 2, sort_keys = True)
+        print('Saved baseline to ' + arguments.baseline)
+    if len(regressions) > 0:
+        print('Slower than the baseline by more than %d%%: %s' % (arguments.threshold * 100, ', '.join(regressions)))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
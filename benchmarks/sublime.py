@@ -0,0 +1,131 @@
+# Minimal stand-in for Sublime Text's sublime module, enough to run autocomplete.py headless
+
+import os
+import tempfile
+
+cache_directory = os.path.join(tempfile.gettempdir(), 'java-autocomplete-benchmarks')
+open_windows = []
+
+class Region:
+    def __init__(self, a, b = None):
+        if b is None:
+            b = a
+        self.a = a
+        self.b = b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+class View:
+    view_count = 0
+
+    def __init__(self, fileName, text = '', window = None):
+        View.view_count += 1
+        self.viewId = View.view_count
+        self.fileName = fileName
+        self.text = text
+        self.changeCount = 1
+        self.selection = [Region(0)]
+        self.parentWindow = window
+        self.statuses = {}
+
+    def id(self):
+        return self.viewId
+
+    def buffer_id(self):
+        return self.viewId
+
+    def file_name(self):
+        return self.fileName
+
+    def size(self):
+        return len(self.text)
+
+    def change_count(self):
+        return self.changeCount
+
+    def window(self):
+        return self.parentWindow
+
+    def sel(self):
+        return self.selection
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self.text[x.begin():x.end()]
+        return self.text[x:x + 1]
+
+    def line(self, x):
+        if isinstance(x, Region):
+            begin = x.begin()
+            end = x.end()
+        else:
+            begin = end = x
+        lineEnd = self.text.find('\n', end)
+        if lineEnd == -1:
+            lineEnd = len(self.text)
+        return Region(self.text.rfind('\n', 0, begin) + 1, lineEnd)
+
+    def set_status(self, key, value):
+        self.statuses[key] = value
+
+    def erase_status(self, key):
+        self.statuses.pop(key, None)
+
+    def run_command(self, name, args = None):
+        pass
+
+class Window:
+    def __init__(self, folders):
+        self.projectFolders = list(folders)
+        self.openViews = []
+
+    def folders(self):
+        return self.projectFolders
+
+    def views(self):
+        return self.openViews
+
+    def active_view(self):
+        if len(self.openViews) == 0:
+            return None
+        return self.openViews[0]
+
+    def extract_variables(self):
+        view = self.active_view()
+        if view is None:
+            return {'file': ''}
+        return {'file': view.file_name()}
+
+    def find_open_file(self, fileName):
+        for view in self.openViews:
+            if view.file_name() == fileName:
+                return view
+        return None
+
+def active_window():
+    return open_windows[0]
+
+def windows():
+    return list(open_windows)
+
+def cache_path():
+    return cache_directory
+
+def set_timeout(callback, delay = 0):
+    callback()
+
+def set_timeout_async(callback, delay = 0):
+    callback()
+
+def status_message(message):
+    pass
@@ -0,0 +1,12 @@
+# Minimal stand-in for Sublime Text's sublime_plugin module
+
+class EventListener:
+    pass
+
+class TextCommand:
+    def __init__(self, view):
+        self.view = view
+
+class WindowCommand:
+    def __init__(self, window):
+        self.window = window
@@ -45,6 +45,8 @@ java_field_pattern = "(?P<indent>\s*)" + \
         "(?: (?P<name>[\w$]+))" + \
         "(?:\s*=.+)?;"
 java_field_pattern = re.compile(java_field_pattern)
+java_literal_pattern = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/', re.DOTALL)
+java_method_pattern = re.compile(r'[\w$\]>]\s+([\w$]+)\s*\([^)]*\)\s*(?:throws[^{;]*)?[{;]')
 
 class JavaGetterSetterCommand(sublime_plugin.TextCommand):
     def run(self, edit):
@@ -165,6 +167,108 @@ class JavaGetterSetterFinishCommand(sublime_plugin.TextCommand):
         self.view.sel().clear()
         self.view.sel().add(sublime.Region(insertPosition, (insertPosition + insertCount)))
 
+class JavaGetterSetterAllCommand(sublime_plugin.TextCommand):
+    def run(self, edit, kind = None):
+        if not isJavaFile(self.view):
+            return
+        if kind is None:
+            if getter_setter_ask:
+                options = [ 'Getters & Setters', 'Getters', 'Setters', 'Cancel' ]
+                sublime.active_window().show_quick_panel(options,
+                        lambda index: self.view.run_command('java_getter_setter_all', {'kind': index}))
+                return
+            kind = 0
+        if kind < 0 or kind > 2:
+            return
+        # One pass over the buffer, then every missing accessor goes in with a single edit
+        text = self.view.substr(sublime.Region(0, self.view.size()))
+        fields, methods = findClassMembers(text)
+        if len(fields) == 0:
+            return
+        lastLine = None
+        for i in range(0, 4):
+            lastLine = sublime.Region(self.view.size() - i, self.view.size() + 1 - i)
+            if self.view.substr(lastLine).startswith('}'):
+                break;
+        inserts = {}
+        lastFieldEnd = fields[-1][0]
+        staticPosition = findLineStart(text, r'\bstatic.*\(', lastFieldEnd, lastLine.begin())
+        classPosition = lastLine.begin()
+        if getter_setter_before_inner_classes:
+            classPosition = min(findLineStart(text, r'\bclass.*\{', lastFieldEnd, lastLine.begin()),
+                    findLineStart(text, r'\binterface.*\{', lastFieldEnd, lastLine.begin()))
+        for lineEnd, fp in fields:
+            accessors = fieldAccessors(fp, kind, methods)
+            if len(accessors) == 0:
+                continue
+            insertPosition = classPosition
+            if instance_getter_setter_before_statics and fp['static'] == None:
+                insertPosition = min(staticPosition, classPosition)
+            inserts.setdefault(insertPosition, []).extend(accessors)
+        for insertPosition in sorted(inserts.keys(), reverse = True):
+            methodsText = '\n\n'.join(inserts[insertPosition]) + '\n'
+            if insertPosition == lastLine.begin():
+                methodsText = '\n' + methodsText
+            else:
+                methodsText += '\n'
+            self.view.insert(edit, insertPosition, methodsText)
+
+def findClassMembers(text):
+    # Private fields and method names declared directly in the top-level class. Methods are
+    # matched on the whole text, so annotations and signatures over several lines are found
+    masked = java_literal_pattern.sub(lambda m: re.sub(r'[^\n]', ' ', m.group()), text)
+    fields = []
+    depth = 0
+    pos = 0
+    for line in masked.split('\n'):
+        if depth == 1:
+            fp = javaFieldPattern(line)
+            if fp.get('access', None) == 'private' and (getter_setter_for_static_fields or not fp['static']) \
+                    and (getter_for_final_fields or not fp['final']):
+                fields.append((pos + len(line), fp))
+        depth += line.count('{') - line.count('}')
+        pos += len(line) + 1
+    methods = set()
+    depth = 0
+    last = 0
+    for m in java_method_pattern.finditer(masked):
+        depth += masked.count('{', last, m.start(1)) - masked.count('}', last, m.start(1))
+        last = m.start(1)
+        if depth == 1:
+            methods.add(m.group(1))
+    return fields, methods
+
+def findLineStart(text, pattern, start, default):
+    m = re.compile(pattern).search(text, start)
+    if m is None:
+        return default
+    return text.rfind('\n', 0, m.start()) + 1
+
+def fieldAccessors(fp, kind, methods):
+    name = fp['name']
+    capName = name[0].capitalize() + name[1:len(name)]
+    if fp['final'] and name.isupper():
+        capName = name.lower()
+        capName = capName[0].capitalize() + capName[1:len(capName)]
+    type = fp['type']
+    indent = fp['indent'].lstrip('\n')
+    accessors = []
+    if kind != 2 and 'get' + capName not in methods:
+        if fp['static'] and fp['final']:
+            accessors.append(g_stat_final_temp.format(capName, type, name, indent))
+        elif fp['static']:
+            accessors.append(g_stat_temp.format(capName, type, name, indent))
+        elif fp['final']:
+            accessors.append(g_final_temp.format(capName, type, name, indent))
+        else:
+            accessors.append(g_temp.format(capName, type, name, indent))
+    if kind != 1 and not fp['final'] and 'set' + capName not in methods:
+        if fp['static']:
+            accessors.append(s_stat_temp.format(capName, type, name, indent))
+        else:
+            accessors.append(s_temp.format(capName, type, name, indent))
+    return accessors
+
 def javaFieldPattern(line):
     m = java_field_pattern.match(line)
     if m: